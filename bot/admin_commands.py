@@ -3,6 +3,7 @@ Admin Commands for Bot Owner
 Only accessible by OWNER_ID
 """
 
+import asyncio
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from config import config
@@ -14,22 +15,25 @@ BACK_BUTTON_TEXT = "◀️ Orqaga"
 ACCESS_DENIED_TEXT = "❌ Ruxsat yo'q!"
 REQUIRED_CHANNEL_KEY = "REQUIRED_CHANNEL="
 
-# Async file helper
-import aiofiles
-
-async def read_env_file(file_path: str) -> list:
-    """Read .env file asynchronously"""
+# Async file helpers (blocking I/O runs in a worker thread)
+def _read_lines(file_path: str) -> list:
     try:
-        async with aiofiles.open(file_path, 'r', encoding='utf-8') as f:
-            content = await f.read()
-            return content.splitlines(keepends=True)
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return f.read().splitlines(keepends=True)
     except FileNotFoundError:
         return []
 
+def _write_lines(file_path: str, lines: list):
+    with open(file_path, 'w', encoding='utf-8') as f:
+        f.writelines(lines)
+
+async def read_env_file(file_path: str) -> list:
+    """Read .env file asynchronously"""
+    return await asyncio.to_thread(_read_lines, file_path)
+
 async def write_env_file(file_path: str, lines: list):
     """Write .env file asynchronously"""
-    async with aiofiles.open(file_path, 'w', encoding='utf-8') as f:
-        await f.writelines(lines)
+    await asyncio.to_thread(_write_lines, file_path, lines)
 
 
 def parse_channel_id(text: str) -> str:
@@ -579,7 +583,7 @@ async def handle_channel_remove(update: Update, context: ContextTypes.DEFAULT_TY
     callback_data = query.data
     channel_index = int(callback_data.split("_")[-1])
     
-    channels = config.get_required_channels()
+    channels = list(config.get_required_channels())
     
     if channel_index >= len(channels):
         await query.answer("❌ Kanal topilmadi!", show_alert=True)
@@ -636,8 +640,8 @@ async def handle_add_channel_message(update: Update, context: ContextTypes.DEFAU
     # Parse and normalize channel ID
     channel_id = parse_channel_id(text)
     
-    # Get current channels
-    channels = config.get_required_channels()
+    # Get current channels (mutable copy)
+    channels = list(config.get_required_channels())
     
     # Check if exists - if yes, remove it; if no, add it
     is_removing = channel_id in channels
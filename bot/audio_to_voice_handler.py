@@ -263,13 +263,11 @@ class AudioToVoiceHandler:
         await processing_msg.edit_text("📤 Ovozli habar yuborilmoqda...")
         
         # Send as voice message
-        import aiofiles
-        async with aiofiles.open(output_path, 'rb') as voice_file:
-            voice_data = await voice_file.read()
-            await update.message.reply_voice(
-                voice=voice_data,
-                caption=f"🎵 Konvertatsiya qilingan audio\n📁 Asl fayl: {file_name}"
-            )
+        voice_data = await asyncio.to_thread(output_path.read_bytes)
+        await update.message.reply_voice(
+            voice=voice_data,
+            caption=f"🎵 Konvertatsiya qilingan audio\n📁 Asl fayl: {file_name}"
+        )
         
         # Delete processing message and send success
         await processing_msg.delete()
@@ -305,7 +303,7 @@ class AudioToVoiceHandler:
         
         try:
             from bot.handlers import check_subscription
-            is_subscribed, missing_channels = await check_subscription(context.bot, user_id)
+            is_subscribed, missing_channels = await check_subscription(context.bot, user_id, fresh=True)
         except Exception as e:
             logger.error(f"Subscription check error: {e}")
             await query.edit_message_text(
@@ -7,6 +7,7 @@ import os
 import sys
 import asyncio
 import subprocess
+import time
 from enum import Enum, auto
 from telegram import Update
 from telegram.ext import (
@@ -33,17 +34,40 @@ class LoginState(Enum):
     WAITING_2FA = auto()
 
 
-async def check_subscription(bot, user_id: int) -> tuple:
+# Subscription results are reused for this many seconds per user
+SUBSCRIPTION_CACHE_TTL = 60.0
+# user_id -> (checked_at, channels, (is_subscribed, missing_channels))
+_sub_cache: dict[int, tuple[float, tuple, tuple]] = {}
+SUBSCRIPTION_CACHE_MAX = 10000
+
+
+async def check_subscription(bot, user_id: int, fresh: bool = False) -> tuple:
     """Check if user is subscribed to ALL required channels.
+    Results are cached per user for SUBSCRIPTION_CACHE_TTL seconds;
+    pass fresh=True to bypass the cache (e.g. "Obunani tekshirish" button).
     Returns: (is_subscribed: bool, missing_channels: list or None)
     """
-    # Reload channels to get latest
-    config.reload_channels()
     channels = config.get_required_channels()
     
     if not channels:
         return True, None  # No channels configured, allow all
     
+    now = time.monotonic()
+    cached = None if fresh else _sub_cache.get(user_id)
+    if cached and cached[1] == channels and now - cached[0] < SUBSCRIPTION_CACHE_TTL:
+        return cached[2]
+    
+    result = await _fetch_subscription(bot, user_id, channels)
+    if len(_sub_cache) >= SUBSCRIPTION_CACHE_MAX:
+        # Drop expired entries so the cache doesn't grow forever
+        for uid in [u for u, v in _sub_cache.items() if now - v[0] >= SUBSCRIPTION_CACHE_TTL]:
+            del _sub_cache[uid]
+    _sub_cache[user_id] = (now, channels, result)
+    return result
+
+
+async def _fetch_subscription(bot, user_id: int, channels: tuple) -> tuple:
+    """Ask Telegram for the user's membership in every channel."""
     missing_channels = []
     bot_errors = []
     
@@ -82,7 +106,6 @@ def get_subscription_keyboard(missing_channels=None):
     
     # Get all channels or use provided missing channels
     if missing_channels is None:
-        config.reload_channels()
         channels = config.get_required_channels()
     else:
         channels = missing_channels
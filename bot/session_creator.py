@@ -7,6 +7,7 @@ Creates session files that can be used by the userbot.
 import os
 import sys
 import asyncio
+from functools import lru_cache
 from typing import Optional, Tuple
 from telethon import TelegramClient
 from telethon.errors import (
@@ -24,6 +25,9 @@ from telethon.sessions import StringSession
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import config
 
+# Resolved once; session paths only depend on user_id
+SESSIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sessions")
+
 
 class SessionCreator:
     """
@@ -277,13 +281,10 @@ def get_session_creator(user_id: int) -> SessionCreator:
     return session_creators[user_id]
 
 
+@lru_cache(maxsize=4096)
 def get_user_session_path(user_id: int) -> str:
     """Get the session file path for a specific user."""
-    return os.path.join(
-        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
-        "sessions",
-        f"session_{user_id}.session"
-    )
+    return os.path.join(SESSIONS_DIR, f"session_{user_id}.session")
 
 
 def remove_session_creator(user_id: int):
@@ -4,81 +4,365 @@ Optimized, stable and safe transcription system using Groq Whisper API.
 """
 
 import os
+import re
+import logging
+import asyncio
+import hashlib
+import tempfile
+import mimetypes
+from pathlib import PurePath
+from collections import OrderedDict
+from types import MappingProxyType
 import httpx
-import aiofiles
+import orjson
 from telegram import Update
 from telegram.ext import ContextTypes
 
 from config import config
 from bot.handlers import check_subscription, get_subscription_keyboard
+from userbot.groq_limits import groq_limiter, backoff_delay
+
+logger = logging.getLogger(__name__)
 
 # Groq API settings
 GROQ_API_URL = "https://api.groq.com/openai/v1/audio/transcriptions"
 WHISPER_MODEL = "whisper-large-v3-turbo"
 TEMP_DIR = "temp_bot_audio"
+os.makedirs(TEMP_DIR, exist_ok=True)
+
+# Groq upload limit
+MAX_FILE_SIZE = 25 * 1024 * 1024
+
+# Files smaller than this that are already Ogg/Opus are uploaded as is
+TRANSCODE_MIN_SIZE = 2 * 1024 * 1024
+
+# Audio longer than this (seconds) is split on silence and sent in parallel
+LONG_AUDIO_THRESHOLD = 120
+SEGMENT_LENGTH = 60
+# How far (seconds) a cut may move from the target to land on silence
+SEGMENT_SLACK = 15
+# ffmpeg silencedetect log line marking the end of a silent stretch
+_SILENCE_RE = re.compile(r"silence_end: ([0-9.]+)")
+
+# Read/write block size for streaming media
+CHUNK_SIZE = 64 * 1024
+
+# Shown to the user on unexpected failures (details are only logged)
+TRANSCRIBE_ERROR_TEXT = "❌ Xatolik yuz berdi. Qaytadan urinib ko'ring."
+
+# Minimum gap between message sends to the same chat (Telegram ~1 msg/sec)
+PER_CHAT_SEND_INTERVAL = 1.05
 
 # MIME type constants
 VIDEO_MP4 = 'video/mp4'
 AUDIO_MPEG = 'audio/mpeg'
 
+# Extension -> MIME type (built once, read-only)
+_MIME_BY_EXT = MappingProxyType({
+    '.mp3': AUDIO_MPEG,
+    '.mp4': 'audio/mp4',
+    '.m4a': 'audio/mp4',
+    '.wav': 'audio/wav',
+    '.ogg': 'audio/ogg',
+    '.oga': 'audio/ogg',
+    '.opus': 'audio/opus',
+    '.flac': 'audio/flac',
+    '.webm': 'audio/webm',
+    '.mkv': VIDEO_MP4,
+    '.mov': VIDEO_MP4,
+    '.avi': VIDEO_MP4,
+    '.wmv': VIDEO_MP4,
+})
+
+# Retry count for transient Groq errors (429 / 5xx)
+MAX_RETRIES = 5
+
+# Concurrent Groq calls from the bot (the request rate itself is governed by
+# the process-wide groq_limiter shared with the userbots)
+MAX_CONCURRENT_REQUESTS = 4
+
+# Recent transcripts keyed by SHA-256 of the audio (duplicate forwards)
+RESULT_CACHE_SIZE = 512
+_result_cache: OrderedDict[str, str] = OrderedDict()
+
+# Shared HTTP client (keeps TLS connections to Groq alive between requests)
+_client: httpx.AsyncClient | None = None
+
+
+async def _get_client() -> httpx.AsyncClient:
+    """Return the shared Groq HTTP client, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(300.0, connect=10.0),
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=50),
+            http2=True,
+        )
+    return _client
+
+
+async def close_http_client():
+    """Close the shared HTTP client (called on shutdown)."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+# ---------------------- RATE LIMITING ----------------------
+
+_rate_limiter = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
 
 # ---------------------- GROQ TRANSCRIPTION ----------------------
 
-async def transcribe_audio_file(file_path: str) -> str:
-    """Send audio to Groq Whisper API and return text."""
+async def transcribe_audio_file(
+    file_path: str, content_hash: str | None = None, duration: int = 0
+) -> str:
+    """Send audio to Groq Whisper API and return text.
+
+    If the caller already hashed the file while downloading it, pass the
+    SHA-256 hex digest as content_hash to skip re-reading it. Audio longer
+    than LONG_AUDIO_THRESHOLD seconds is transcribed in parallel segments.
+    """
     if not config.GROQ_API_KEY:
         return "❌ GROQ_API_KEY sozlanmagan"
 
     try:
-        mime_type = _detect_mime(file_path)
+        if content_hash is None:
+            content_hash = await asyncio.to_thread(_hash_file, file_path)
 
-        async with aiofiles.open(file_path, "rb") as audio_file:
-            file_content = await audio_file.read()
+        cached = _result_cache.get(content_hash)
+        if cached is not None:
+            _result_cache.move_to_end(content_hash)
+            return cached
+
+        upload_path = await _transcode_for_upload(file_path)
+        try:
+            if duration > LONG_AUDIO_THRESHOLD:
+                text = await _transcribe_segments(upload_path, duration, content_hash)
+            else:
+                text = await _request_transcription(upload_path, content_hash)
+        finally:
+            if upload_path != file_path:
+                await asyncio.to_thread(_safe_unlink, upload_path)
+
+        if not text.startswith("❌"):
+            _cache_result(content_hash, text)
+        return text
+
+    except Exception as e:
+        logger.error(f"Groq transcription error: {e}")
+        return TRANSCRIBE_ERROR_TEXT
+
+
+async def _request_transcription(file_path: str, idempotency_key: str) -> str:
+    """POST one file to Groq (with retries) and return text or an error string."""
+    path = PurePath(file_path)
+    mime_type = _detect_mime(path.suffix.lower())
+    data = {
+        "model": WHISPER_MODEL,
+        "response_format": "json",
+        "temperature": 0.0
+    }
+    headers = {
+        "Authorization": f"Bearer {config.GROQ_API_KEY}",
+        "Idempotency-Key": idempotency_key,
+    }
 
+    client = await _get_client()
+    # httpx streams the open file into the multipart body chunk by chunk
+    with open(file_path, "rb") as audio_file:
         files = {
-            "file": (os.path.basename(file_path), file_content, mime_type),
-        }
-        data = {
-            "model": WHISPER_MODEL,
-            "response_format": "json",
-            "temperature": 0.0
+            "file": (path.name, audio_file, mime_type),
         }
-        headers = {"Authorization": f"Bearer {config.GROQ_API_KEY}"}
+        est_tokens = os.fstat(audio_file.fileno()).st_size // 1000
+        for attempt in range(MAX_RETRIES):
+            await groq_limiter.wait_if_throttled(est_tokens)
+            audio_file.seek(0)
+            async with _rate_limiter:
+                response = await client.post(
+                    GROQ_API_URL, files=files, data=data, headers=headers
+                )
+            groq_limiter.update(response.headers)
+
+            # Retry rate limits and server errors, give up on anything else
+            retryable = response.status_code == 429 or response.status_code >= 500
+            if not retryable or attempt == MAX_RETRIES - 1:
+                break
+            delay = backoff_delay(attempt, response.headers.get("retry-after"))
+            if response.status_code == 429:
+                # The key is shared, so hold back every caller, not just this one
+                groq_limiter.block_for(delay)
+            else:
+                await asyncio.sleep(delay)
+
+    if response.status_code == 200:
+        result = orjson.loads(response.content)
+        text = result.get("text", "").strip()
+        return text if text else "❌ Matn topilmadi"
+
+    return f"❌ API xatolik {response.status_code}"
+
+
+async def _transcode_for_upload(file_path: str) -> str:
+    """Re-encode audio to 16 kHz mono Opus to shrink the upload.
+
+    Whisper resamples to 16 kHz mono anyway, so quality is unchanged while
+    video streams and high bitrates are dropped. Returns the path to upload
+    (the original one if transcoding is skipped or fails).
+    """
+    path = PurePath(file_path)
+    size = await asyncio.to_thread(os.path.getsize, file_path)
+    if path.suffix.lower() in (".ogg", ".oga", ".opus") and size <= TRANSCODE_MIN_SIZE:
+        return file_path
+
+    output_path = str(path.with_name(f"{path.stem}_16k.ogg"))
+    try:
+        process = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-y", "-i", file_path,
+            "-vn", "-ac", "1", "-ar", "16000",
+            "-c:a", "libopus", "-b:a", "24k", "-f", "ogg",
+            output_path,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+    except FileNotFoundError:
+        # ffmpeg not installed - upload as is
+        return file_path
+    try:
+        returncode = await process.wait()
+    except asyncio.CancelledError:
+        # Don't leave ffmpeg writing into TEMP_DIR after we are gone
+        await _kill_process(process)
+        await asyncio.to_thread(_safe_unlink, output_path)
+        raise
+
+    if returncode != 0:
+        await asyncio.to_thread(_safe_unlink, output_path)
+        return file_path
+    return output_path
+
+
+async def _transcribe_segments(file_path: str, duration: int, content_hash: str) -> str:
+    """Split long audio on silence and transcribe the parts concurrently.
+
+    The shared groq_limiter still governs the request rate; results are joined in
+    segment order.
+    """
+    segments = await _split_on_silence(file_path, duration)
+    if len(segments) < 2:
+        return await _request_transcription(file_path, content_hash)
+
+    try:
+        texts = await asyncio.gather(*(
+            _request_transcription(segment, f"{content_hash}-{idx}")
+            for idx, segment in enumerate(segments)
+        ))
+    finally:
+        for segment in segments:
+            await asyncio.to_thread(_safe_unlink, segment)
+
+    for text in texts:
+        if text.startswith("❌") and text != "❌ Matn topilmadi":
+            return text
+    parts = [text for text in texts if not text.startswith("❌")]
+    return " ".join(parts) if parts else "❌ Matn topilmadi"
+
+
+async def _run_ffmpeg(*args: str) -> tuple[int, bytes]:
+    """Run ffmpeg quietly and return (returncode, stderr)."""
+    process = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-hide_banner", "-y", *args,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        _, stderr = await process.communicate()
+    except asyncio.CancelledError:
+        await _kill_process(process)
+        raise
+    return process.returncode, stderr
+
+
+async def _kill_process(process: asyncio.subprocess.Process):
+    """Kill a still-running subprocess (e.g. when the handler is cancelled)."""
+    if process.returncode is None:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+        await process.wait()
+
 
-        async with httpx.AsyncClient(timeout=300.0) as client:
-            response = await client.post(
-                GROQ_API_URL, files=files, data=data, headers=headers
+async def _split_on_silence(file_path: str, duration: int) -> list[str]:
+    """Cut audio into ~SEGMENT_LENGTH pieces aligned to silences.
+
+    Returns the segment paths, or an empty list if ffmpeg is unavailable or
+    any cut fails (the caller then uploads the whole file).
+    """
+    try:
+        returncode, stderr = await _run_ffmpeg(
+            "-i", file_path, "-af", "silencedetect=n=-30dB:d=0.5", "-f", "null", "-"
+        )
+    except FileNotFoundError:
+        return []
+    if returncode != 0:
+        return []
+
+    silences = [float(m) for m in _SILENCE_RE.findall(stderr.decode(errors="ignore"))]
+    cuts = [0.0]
+    target = SEGMENT_LENGTH
+    while target < duration - SEGMENT_SLACK:
+        near = [t for t in silences if abs(t - target) <= SEGMENT_SLACK and t > cuts[-1]]
+        cut = min(near, key=lambda t: abs(t - target)) if near else float(target)
+        cuts.append(cut)
+        target = cut + SEGMENT_LENGTH
+
+    path = PurePath(file_path)
+    segments = []
+    complete = False
+    try:
+        for idx, start in enumerate(cuts):
+            segment = str(path.with_name(f"{path.stem}_part{idx}{path.suffix}"))
+            args = ["-ss", f"{start:.3f}"]
+            if idx + 1 < len(cuts):
+                args += ["-to", f"{cuts[idx + 1]:.3f}"]
+            segments.append(segment)
+            returncode, _ = await _run_ffmpeg(
+                "-i", file_path, *args, "-vn", "-c", "copy", segment
             )
+            if returncode != 0:
+                return []
+        complete = True
+        return segments
+    finally:
+        # A failed cut or a cancelled handler leaves no partial segments behind
+        if not complete:
+            for seg in segments:
+                await asyncio.to_thread(_safe_unlink, seg)
 
-        if response.status_code == 200:
-            result = response.json()
-            text = result.get("text", "").strip()
-            return text if text else "❌ Matn topilmadi"
 
-        return f"❌ API xatolik {response.status_code}"
+def _hash_file(file_path: str) -> str:
+    """SHA-256 of a file, read in chunks (run via to_thread)."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-    except Exception as e:
-        return f"❌ Xatolik: {str(e)}"
-
-
-def _detect_mime(file_path: str) -> str:
-    """Auto-detect mime type."""
-    ext = os.path.splitext(file_path)[1].lower()
-    mime_map = {
-        '.mp3': 'audio/mpeg',
-        '.mp4': 'audio/mp4',
-        '.m4a': 'audio/mp4',
-        '.wav': 'audio/wav',
-        '.ogg': 'audio/ogg',
-        '.opus': 'audio/opus',
-        '.flac': 'audio/flac',
-        '.webm': 'audio/webm',
-        '.mkv': VIDEO_MP4,
-        '.mov': VIDEO_MP4,
-        '.avi': VIDEO_MP4,
-        '.wmv': VIDEO_MP4,
-    }
-    return mime_map.get(ext, AUDIO_MPEG)
+
+def _cache_result(content_hash: str, text: str):
+    """Store a transcript, evicting the least recently used entry when full."""
+    _result_cache[content_hash] = text
+    _result_cache.move_to_end(content_hash)
+    if len(_result_cache) > RESULT_CACHE_SIZE:
+        _result_cache.popitem(last=False)
+
+
+def _detect_mime(ext: str) -> str:
+    """Mime type for a lower-case file suffix (e.g. ".ogg")."""
+    return _MIME_BY_EXT.get(ext, AUDIO_MPEG)
 
 
 # ---------------------- COMMAND HANDLER ----------------------
@@ -149,36 +433,96 @@ async def _check_user_permissions(message, context) -> bool:
     return True
 
 
+def _get_media(message):
+    """Return the media attachment of the message (or None)."""
+    return (
+        message.voice or message.audio or message.video or
+        message.video_note or message.document
+    )
+
+
 def _get_file_size(message) -> int:
     """Get file size from message media."""
-    if message.voice:
-        return message.voice.file_size or 0
-    if message.audio:
-        return message.audio.file_size or 0
-    if message.video:
-        return message.video.file_size or 0
-    if message.document:
-        return message.document.file_size or 0
-    return 0
+    media = _get_media(message)
+    return (media.file_size or 0) if media else 0
+
+
+def _get_duration(message) -> int:
+    """Media duration in seconds from metadata (0 if unknown)."""
+    media = _get_media(message)
+    return getattr(media, "duration", None) or 0
+
+
+def _validate_media(message) -> tuple[bool, str | None]:
+    """Check media limits from message metadata only (no Telegram API calls)."""
+    if _get_file_size(message) > MAX_FILE_SIZE:
+        return False, "❌ *Fayl juda katta!* Maksimal 25 MB."
+    return True, None
 
 
 async def _get_media_file(message):
     """Get file object from message media."""
+    media = _get_media(message)
+    return await media.get_file() if media else None
+
+
+def _ext_for(message) -> str:
+    """Pick a temp file extension that matches the real media type."""
     if message.voice:
-        return await message.voice.get_file()
-    if message.audio:
-        return await message.audio.get_file()
-    if message.video:
-        return await message.video.get_file()
-    if message.video_note:
-        return await message.video_note.get_file()
-    if message.document:
-        return await message.document.get_file()
-    return None
+        return ".ogg"
+    if message.video or message.video_note:
+        return ".mp4"
+    media = message.audio or message.document
+    if media:
+        if media.file_name:
+            ext = PurePath(media.file_name).suffix.lower()
+            if ext:
+                return ext
+        if media.mime_type:
+            return mimetypes.guess_extension(media.mime_type) or ""
+    return ""
+
+
+def _safe_unlink(file_path: str):
+    """Remove a file, ignoring it if already gone or locked."""
+    try:
+        os.unlink(file_path)
+    except OSError:
+        pass
+
+
+async def _download_media(file, dest_path: str) -> str:
+    """Download a Telegram file to disk and return its SHA-256 hex digest.
+
+    Goes through PTB (its request/proxy settings apply) rather than fetching
+    file.file_path directly, since that URL embeds the bot token.
+    """
+    await file.download_to_drive(dest_path)
+    return await asyncio.to_thread(_hash_file, dest_path)
 
 
 # ---------------------- RESULT SENDER ----------------------
 
+def _split_text(text: str, max_chunk: int) -> list[str]:
+    """Split text into chunks of at most max_chunk chars without cutting words."""
+    parts = []
+    start = 0
+    while len(text) - start > max_chunk:
+        end = start + max_chunk
+        cut = text.rfind("\n", start, end)
+        if cut <= start:
+            cut = text.rfind(" ", start, end)
+        if cut <= start:
+            # No break point in range, hard cut
+            parts.append(text[start:end])
+            start = end
+        else:
+            parts.append(text[start:cut])
+            start = cut + 1
+    parts.append(text[start:])
+    return parts
+
+
 async def _send_transcription_result(processing_msg, text, update):
     """Send transcription result safely without using edit_text()."""
 
@@ -207,8 +551,8 @@ async def _send_transcription_result(processing_msg, text, update):
         )
         return
 
-    # Long message → split
-    parts = [text[i:i + max_chunk] for i in range(0, len(text), max_chunk)]
+    # Long message → split on line/word boundaries
+    parts = _split_text(text, max_chunk)
     total = len(parts)
 
     # First part
@@ -219,17 +563,19 @@ async def _send_transcription_result(processing_msg, text, update):
         parse_mode="Markdown"
     )
 
-    # Remaining parts
-    for idx in range(1, total):
-        chunk = parts[idx]
+    # Remaining parts: start one per interval (Telegram per-chat limit)
+    # but let their round-trips overlap instead of awaiting each in turn
+    async def send_part(idx: int):
+        await asyncio.sleep((idx - 1) * PER_CHAT_SEND_INTERVAL)
         last = (idx == total - 1)
-
         await update.message.reply_text(
             f"*Qism {idx+1}/{total}*\n\n"
-            f"{chunk}{footer if last else ''}",
+            f"{parts[idx]}{footer if last else ''}",
             parse_mode="Markdown"
         )
 
+    await asyncio.gather(*(send_part(idx) for idx in range(1, total)))
+
 
 # ---------------------- MAIN HANDLER ----------------------
 
@@ -239,19 +585,17 @@ async def handle_audio_message(update: Update, context: ContextTypes.DEFAULT_TYP
     if not _has_supported_media(message):
         return
 
+    # Reject oversized media before any Telegram API round-trip
+    is_valid, error_text = _validate_media(message)
+    if not is_valid:
+        await message.reply_text(error_text, parse_mode="Markdown")
+        return
+
     if not await _check_user_permissions(message, context):
         return
 
-    # FILE SIZE CHECK
     file_size = _get_file_size(message)
 
-    if file_size > 25 * 1024 * 1024:
-        await message.reply_text(
-            "❌ *Fayl juda katta!* Maksimal 25 MB.",
-            parse_mode="Markdown"
-        )
-        return
-
     processing_msg = await message.reply_text(
         f"🎙️ *Audio matnlashtirilmoqda...*\n"
         f"📊 Fayl hajmi: {file_size/1024/1024:.1f} MB\n"
@@ -262,30 +606,32 @@ async def handle_audio_message(update: Update, context: ContextTypes.DEFAULT_TYP
     file_path = None
 
     try:
-        os.makedirs(TEMP_DIR, exist_ok=True)
-
         file = await _get_media_file(message)
-        file_path = os.path.join(TEMP_DIR, f"{message.message_id}.ogg")
-        await file.download_to_drive(file_path)
+        with tempfile.NamedTemporaryFile(
+            dir=TEMP_DIR, suffix=_ext_for(message), delete=False
+        ) as tmp:
+            file_path = tmp.name
+        content_hash = await _download_media(file, file_path)
 
         await processing_msg.edit_text(
             "🔄 *Whisper AI ishlayapti...*\n⏳ Kuting...",
             parse_mode="Markdown"
         )
 
-        text = await transcribe_audio_file(file_path)
+        text = await transcribe_audio_file(
+            file_path, content_hash, _get_duration(message)
+        )
 
         await _send_transcription_result(processing_msg, text, update)
 
     except Exception as e:
+        # Details go to the log only - exception text may contain URLs/secrets
+        logger.error(f"Transcription error: {e}")
         try:
-            await processing_msg.edit_text(f"❌ Xatolik: {str(e)[:200]}")
+            await processing_msg.edit_text(TRANSCRIBE_ERROR_TEXT)
         except Exception:
-            await message.reply_text(f"❌ Xatolik: {str(e)[:200]}")
+            await message.reply_text(TRANSCRIBE_ERROR_TEXT)
 
     finally:
-        if file_path and os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-            except OSError:
-                pass
+        if file_path:
+            await asyncio.to_thread(_safe_unlink, file_path)
@@ -4,11 +4,15 @@ Loads all environment variables and provides configuration constants.
 """
 
 import os
+from typing import Optional
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
+# .env location (project root), watched for channel changes
+ENV_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env")
+
 
 class Config:
     """Main configuration class containing all settings."""
@@ -38,21 +42,34 @@ class Config:
     # Subscription Configuration (can be comma-separated for multiple channels)
     REQUIRED_CHANNEL: str = os.getenv("REQUIRED_CHANNEL", "")
     
+    # Parsed channels (immutable), refreshed only when REQUIRED_CHANNEL changes
+    CHANNELS: tuple = ()
+    _env_mtime_ns: Optional[int] = None
+    _channels_source: Optional[str] = None
+    
     @classmethod
-    def get_required_channels(cls) -> list:
-        """Get list of required channels from comma-separated string."""
-        # Reload from env to get latest value
+    def get_required_channels(cls) -> tuple:
+        """Get tuple of required channels from comma-separated string."""
+        # Pick up .env edits (cheap stat, re-parse only on change)
         cls.reload_channels()
-        if cls.REQUIRED_CHANNEL:
-            return [ch.strip() for ch in cls.REQUIRED_CHANNEL.split(",") if ch.strip()]
-        return []
+        if cls.REQUIRED_CHANNEL != cls._channels_source:
+            cls._channels_source = cls.REQUIRED_CHANNEL
+            cls.CHANNELS = tuple(
+                ch.strip() for ch in (cls.REQUIRED_CHANNEL or "").split(",") if ch.strip()
+            )
+        return cls.CHANNELS
     
     @classmethod
     def reload_channels(cls):
-        """Reload REQUIRED_CHANNEL from environment"""
-        import os
-        from dotenv import load_dotenv
-        load_dotenv(override=True)
+        """Reload REQUIRED_CHANNEL from .env if the file changed since last load"""
+        try:
+            mtime_ns = os.stat(ENV_FILE).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+        if mtime_ns == cls._env_mtime_ns:
+            return
+        cls._env_mtime_ns = mtime_ns
+        load_dotenv(ENV_FILE, override=True)
         cls.REQUIRED_CHANNEL = os.getenv("REQUIRED_CHANNEL", "")
     
     # Auto-sleep Configuration (in hours, 0 = disabled)
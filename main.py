@@ -6,182 +6,361 @@ Runs both the login bot and userbot together.
 """
 
 import os
+import re
 import sys
+import time
+import heapq
+import signal
 import asyncio
+import itertools
+import contextlib
 import logging
-import glob
+import functools
+from datetime import datetime
 
 # Ensure we're in the project directory
 PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
 os.chdir(PROJECT_DIR)
 sys.path.insert(0, PROJECT_DIR)
 
-from telegram import Update
+from telegram import Update, BotCommand, MenuButtonCommands
+from telegram.error import BadRequest
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters
 from telegram.request import HTTPXRequest
+from telethon import TelegramClient
 
 from config import config
 from bot.handlers import (
     start_command,
+    check_subscription,
+    get_subscription_keyboard,
     get_login_conversation_handler,
     get_audio_to_voice_handler,
     WELCOME_MESSAGE
 )
 from bot.keyboards import Keyboards
 from bot.session_creator import get_user_session_path
-from bot.transcribe_handler import transcribe_command, handle_audio_message
+from bot.transcribe_handler import transcribe_command, handle_audio_message, close_http_client
 from bot.admin_commands import (
     cmd_admin_panel, cmd_set_channel, cmd_remove_channel, cmd_check_config,
     handle_admin_config, handle_admin_set_channel, handle_admin_remove_channel, handle_admin_refresh,
     handle_admin_channels_view, handle_admin_channels_manage, handle_admin_add_channel_info, 
     handle_admin_remove_channel_info, handle_channel_remove, handle_add_channel_message
 )
+from userbot.loader import ModuleLoader
 
-# Configure logging - minimal output
+# Configure logging - minimal output from libraries, userbot lifecycle at INFO
 logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s',
     level=logging.WARNING
 )
 logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
 
 # Sessions directory
 SESSIONS_DIR = os.path.join(PROJECT_DIR, "sessions")
 os.makedirs(SESSIONS_DIR, exist_ok=True)
 
+# Static reply texts (Markdown)
+HELP_TEXT = """
+🤖 **Telethon Userbot Boshqaruv Tizimi**
+
+**Bot haqida:**
+Bu bot sizning Telegram akkauntingizga userbot ulash va boshqarish imkonini beradi. Userbot - bu sizning akkauntingiz orqali ishlaydigan va turli buyruqlarni bajaradigan maxsus dastur.
+
+**Asosiy imkoniyatlar:**
+• Akkauntni xavfsiz ulash (2FA qo'llab-quvvatlash bilan)
+• Userbotni ishga tushirish va boshqarish
+• Medialarni saqlash (.ok buyrug'i)
+• AI bilan suhbat (.ask buyrug'i)
+• Audio/voice transkript (bot va userbot)
+• Avtomatik uxlash rejimi
+
+**Qanday foydalanish:**
+
+1️⃣ **Akkaunt ulash:**
+   • /start buyrug'ini yuboring
+   • "🔗 Akkaunt ulash" tugmasini bosing
+   • Telefon raqamingizni kiriting
+   • Telegram'dan kelgan kodni kiriting
+   • Agar 2FA yoqilgan bo'lsa, parolingizni kiriting
+
+2️⃣ **Userbotni ishga tushirish:**
+   • Akkaunt ulanganidan keyin
+   • "🚀 Userbot ishga tushirish" tugmasini bosing
+   • Userbot fonda ishlaydi
+
+3️⃣ **Userbot buyruqlari:**
+   • `.ok` - Mediaga javob berib saqlash (Saqlangan Xabarlarga)
+   • `.ask <savol>` - AI dan so'rash (javob o'sha chatda)
+   • `.transcribe` - Audio/voice/video ni matnga (Whisper AI)
+   • `.help` - Barcha buyruqlarni ko'rish
+
+4️⃣ **Bot buyruqlari:**
+   • /transcribe - Audio transkript ma'lumotini olish
+   • Audio yuborish - Botga to'g'ridan-to'g'ri audio/voice yuborsangiz avtomatik matnga aylanadi
+
+**Xavfsizlik:**
+✅ Faqat siz o'z userbotingizni boshqarasiz
+✅ Buyruqlar avtomatik o'chiriladi
+✅ `.ok` javoblari Saqlangan Xabarlarga boradi
+
+**Yordam kerakmi?**
+Muammo bo'lsa, /start bosib qaytadan urinib ko'ring.
+"""
+
+USERBOT_STARTED_TEXT = (
+    "✅ **Userbotingiz ishlamoqda!**\n\n"
+    "📱 **Buyruqlar:**\n"
+    "• `.ok` - Media saqlash\n"
+    "• `.ask <savol>` - AI suhbat\n"
+    "• `.transcribe` - Audio → Text\n"
+    "• `.help` - To'liq qo'llanma\n\n"
+    "🎙️ **Whisper AI:** Har qanday til, har qanday format"
+)
+
+USERBOT_RESTARTED_TEXT = (
+    "✅ **Userbotingiz qayta ishladi!**\n\n"
+    "Endi ishlashi kerak.\n"
+    "Sinash uchun `.help` yozing."
+)
+
+# Bot menu commands (set once the bot has started)
+_BOT_COMMANDS = (
+    BotCommand("start", "Botni ishga tushirish va boshqaruv paneli"),
+    BotCommand("help", "Bot haqida ma'lumot va yordam"),
+    BotCommand("transcribe", "Audio/voice ni matnga aylantirish (Whisper AI)"),
+    BotCommand("audio2voice", "Audio faylni ovozli habarga aylantirish (FFmpeg)"),
+)
+_MENU_BUTTON = MenuButtonCommands()
+
 # Global reference to userbot tasks and clients (per user)
 userbot_tasks: dict = {}
 userbot_clients: dict = {}
+userbot_loaders: dict = {}  # Module loaders, torn down on logout/shutdown
 userbot_start_times: dict = {}  # Track when each userbot started
 
+# Auto-sleep queue: (deadline, seq, user_id, run start time), min-heap on deadline
+_sleep_heap: list = []
+_sleep_seq = itertools.count()
+_sleep_wakeup = asyncio.Event()
+_sleep_scheduler = None
+
+# Max concurrent MTProto handshakes while userbots start up
+_STARTUP_SEM = asyncio.Semaphore(12)
+
+# session_<user_id>.session
+SESSION_RE = re.compile(r"^session_(\d+)\.session$")
+
+def _scan_session_user_ids() -> list[int]:
+    """User IDs of all session_<user_id>.session files, in a single scandir pass."""
+    with os.scandir(SESSIONS_DIR) as entries:
+        return [
+            int(m.group(1))
+            for entry in entries
+            if (m := SESSION_RE.match(entry.name))
+        ]
+
+
+def _delete_session(user_id: int) -> bool:
+    """Remove the user's session file (and SQLite journal).
+    Returns False if there was no session; raises OSError if it can't be removed.
+    """
+    session_path = get_user_session_path(user_id)
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(f"{session_path}-journal")
+    try:
+        os.unlink(session_path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+async def _remove_session_file(user_id: int) -> bool:
+    """_delete_session, briefly retrying while the file is still locked (Windows)."""
+    delay = 0.05
+    while True:
+        try:
+            return _delete_session(user_id)
+        except PermissionError:
+            if delay >= 0.4:
+                raise
+            await asyncio.sleep(delay)
+            delay *= 2
+
+
+@functools.lru_cache(maxsize=64)
+def _subscribe_prompt(missing_channels: tuple) -> str:
+    """HTML body asking the user to join the missing channels."""
+    channels_text = "\n".join(f"• {ch}" for ch in missing_channels)
+    return (
+        f"⚠️ <b>Obuna talab qilinadi!</b>\n\n"
+        f"Botdan foydalanish uchun avval kanallarga obuna bo'ling:\n\n"
+        f"{channels_text}\n\n"
+        f"Obuna bo'lgandan so'ng \"✅ Obunani tekshirish\" tugmasini bosing."
+    )
+
 
 async def run_userbot_for_user(user_id: int):
     """Run the userbot for a specific user."""
-    from telethon import TelegramClient
-    from userbot.loader import ModuleLoader
-    from datetime import datetime, timedelta
-    
-    global userbot_clients, userbot_start_times
+    # Local aliases for the module-level state used throughout
+    clients = userbot_clients
+    sleep_hours = config.AUTO_SLEEP_HOURS
     
     session_path = get_user_session_path(user_id)
     session_name = session_path.replace('.session', '')
     
     if not os.path.exists(session_path):
-        print("⏳ No session for user {}".format(user_id))
+        logger.info(f"⏳ No session for user {user_id}")
         return None
     
-    print("🚀 Starting Userbot for user {}...".format(user_id))
-    
-    client = TelegramClient(
-        session_name,
-        config.API_ID,
-        config.API_HASH,
-        device_model="Desktop",
-        system_version="Windows 10",
-        app_version="Userbot 1.0",
-        lang_code="en"
-    )
+    logger.info(f"🚀 Starting Userbot for user {user_id}...")
+    
+    # Reuse the client from a previous run (e.g. after auto-sleep) so waking
+    # up is just a reconnect on the existing session
+    client = clients.get(user_id)
+    if client is None:
+        client = TelegramClient(
+            session_name,
+            config.API_ID,
+            config.API_HASH,
+            device_model="Desktop",
+            system_version="Windows 10",
+            app_version="Userbot 1.0",
+            lang_code="en"
+        )
+        clients[user_id] = client
     
-    # Store client reference and start time
-    userbot_clients[user_id] = client
+    # Store start time
     userbot_start_times[user_id] = datetime.now()
     
     try:
-        await client.connect()
+        async with _STARTUP_SEM:
+            await client.connect()
+            authorized = await client.is_user_authorized()
+            me = await client.get_me() if authorized else None
         
-        if not await client.is_user_authorized():
-            print(f"❌ Session not authorized for user {user_id}")
-            print(f"   Session file: {session_path}")
+        if not authorized:
+            logger.error(f"❌ Session not authorized for user {user_id} ({session_path})")
             # Delete invalid session
             try:
                 await client.disconnect()
-                del userbot_clients[user_id]
-                os.remove(session_path)
-                print("   Deleted invalid session file")
+                clients.pop(user_id, None)
+                _delete_session(user_id)
+                logger.info(f"Deleted invalid session file for user {user_id}")
             except OSError as e:
-                print("   Could not delete session: {}".format(e))
+                logger.error(f"Could not delete session for user {user_id}: {e}")
             return None
         
-        me = await client.get_me()
-        sleep_hours = config.AUTO_SLEEP_HOURS
         sleep_info = f" (uxlash: {sleep_hours} soatdan keyin)" if sleep_hours > 0 else ""
-        print(f"✅ Userbot for {me.first_name} (@{me.username or 'N/A'}) - ID: {me.id}{sleep_info}")
+        logger.info(f"✅ Userbot for {me.first_name} (@{me.username or 'N/A'}) - ID: {me.id}{sleep_info}")
         
-        # Load modules (each user gets their own module instance)
-        loader = ModuleLoader(client, me.id)
-        loaded = loader.load_all_modules()
-        print(f"📦 Loaded {loaded} module(s) for user {me.id}")
+        # Load modules (each user gets their own module instance). Handlers
+        # stay registered on a reused client, so only load them once.
+        if not client.list_event_handlers():
+            loader = ModuleLoader(client, me.id)
+            userbot_loaders[user_id] = loader
+            # Module bodies execute in worker threads; setup() and handler
+            # registration stay on the loop thread
+            loaded = await loader.load_all_modules_async()
+            logger.info(f"📦 Loaded {loaded} module(s) for user {me.id}")
         
         # Auto-sleep logic
         if sleep_hours > 0:
-            sleep_time = sleep_hours * 3600  # Convert to seconds
-            
-            async def auto_sleep_timer():
-                await asyncio.sleep(sleep_time)
-                print(f"😴 Auto-sleep: Userbot for user {user_id} going to sleep after {sleep_hours} hours")
-                if client.is_connected():
-                    await client.disconnect()
-            
-            # Start auto-sleep timer in background
-            sleep_task = asyncio.create_task(auto_sleep_timer())
-            # Keep reference to prevent garbage collection
-            sleep_task.add_done_callback(lambda t: None)
+            _schedule_sleep(user_id, sleep_hours * 3600)  # Convert to seconds
         
         # Run until disconnected
         await client.run_until_disconnected()
         
     except Exception as e:
-        print(f"❌ Userbot error for user {user_id}: {e}")
+        logger.error(f"❌ Userbot error for user {user_id}: {e}")
     finally:
         if client and client.is_connected():
             await client.disconnect()
-        if user_id in userbot_clients:
-            del userbot_clients[user_id]
-        if user_id in userbot_start_times:
-            del userbot_start_times[user_id]
+
+
+def _schedule_sleep(user_id: int, delay: float):
+    """Queue an auto-sleep for the user's current run."""
+    global _sleep_scheduler
+    entry = (time.monotonic() + delay, next(_sleep_seq), user_id, userbot_start_times.get(user_id))
+    heapq.heappush(_sleep_heap, entry)
+    _sleep_wakeup.set()
+    if _sleep_scheduler is None or _sleep_scheduler.done():
+        _sleep_scheduler = asyncio.create_task(_auto_sleep_scheduler())
+
+
+async def _auto_sleep_scheduler():
+    """Single task that disconnects userbots once their sleep time is due."""
+    while True:
+        if not _sleep_heap:
+            _sleep_wakeup.clear()
+            await _sleep_wakeup.wait()
+            continue
+        
+        delay = _sleep_heap[0][0] - time.monotonic()
+        if delay > 0:
+            # Wait for the earliest deadline or a newly queued entry
+            _sleep_wakeup.clear()
+            try:
+                await asyncio.wait_for(_sleep_wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        
+        _, _, user_id, started_at = heapq.heappop(_sleep_heap)
+        client = userbot_clients.get(user_id)
+        # Skip entries from an earlier run (user woke the userbot up since)
+        if client is None or userbot_start_times.get(user_id) != started_at:
+            continue
+        logger.info(f"😴 Auto-sleep: Userbot for user {user_id} going to sleep after {config.AUTO_SLEEP_HOURS} hours")
+        if client.is_connected():
+            try:
+                await client.disconnect()
+            except Exception as e:
+                logger.warning(f"⚠️ Auto-sleep error for user {user_id}: {e}")
+
+
+def _reap_task(user_id: int, task: asyncio.Task):
+    """Drop a finished userbot task and its start time.
+
+    The client itself stays in userbot_clients for reuse on wake-up; only
+    logout or an invalid session removes it.
+    """
+    # A wake-up may already have replaced the task for this user
+    if userbot_tasks.get(user_id) is not task:
+        return
+    userbot_tasks.pop(user_id, None)
+    userbot_start_times.pop(user_id, None)
 
 
 async def start_userbot_for_user_background(user_id: int):
     """Start userbot for a specific user in background."""
-    global userbot_tasks, userbot_clients
-    
     # Check if already running
-    if user_id in userbot_tasks and not userbot_tasks[user_id].done():
-        print(f"⚠️ Userbot for user {user_id} already running, skipping...")
+    task = userbot_tasks.get(user_id)
+    if task is not None and not task.done():
+        logger.warning(f"⚠️ Userbot for user {user_id} already running, skipping...")
         return
     
-    # First disconnect client if exists
-    if user_id in userbot_clients:
-        try:
-            client = userbot_clients[user_id]
-            if client.is_connected():
-                await client.disconnect()
-            del userbot_clients[user_id]
-        except Exception:
-            pass
-        await asyncio.sleep(1)  # Wait for resources to be released
-    
     # Start new userbot task for this user
-    userbot_tasks[user_id] = asyncio.create_task(run_userbot_for_user(user_id))
+    task = asyncio.create_task(run_userbot_for_user(user_id))
+    task.add_done_callback(functools.partial(_reap_task, user_id))
+    userbot_tasks[user_id] = task
 
 
 async def post_init(application: Application):
     """Called after the bot is initialized. Start all existing user sessions."""
     # Find all session files
-    session_files = glob.glob(os.path.join(SESSIONS_DIR, "session_*.session"))
-    
-    if session_files:
-        print(f"📁 Found {len(session_files)} existing session(s)")
-        for session_file in session_files:
-            # Extract user_id from filename (session_123456.session)
-            filename = os.path.basename(session_file)
-            try:
-                user_id = int(filename.replace("session_", "").replace(".session", ""))
-                await start_userbot_for_user_background(user_id)
-                await asyncio.sleep(2)  # Delay between starting userbots
-            except ValueError:
-                continue
+    user_ids = _scan_session_user_ids()
+    
+    if user_ids:
+        logger.info(f"📁 Found {len(user_ids)} existing session(s)")
+        # Handshakes are bounded by _STARTUP_SEM inside run_userbot_for_user
+        await asyncio.gather(
+            *(start_userbot_for_user_background(user_id) for user_id in user_ids),
+            return_exceptions=True
+        )
     else:
-        print("⏳ No existing sessions. Users can create sessions via the bot.")
+        logger.info("⏳ No existing sessions. Users can create sessions via the bot.")
 
 
 async def main():
@@ -193,23 +372,26 @@ async def main():
     print("=" * 50)
     
     # Create bot application with custom timeout settings
+    # Large HTTP/2 pool: handlers send several Bot API calls back-to-back
     request = HTTPXRequest(
-        connection_pool_size=8,
+        connection_pool_size=256,
         read_timeout=30.0,
         write_timeout=30.0,
         connect_timeout=30.0,
         pool_timeout=30.0,
+        http_version="2",
     )
     application = (
         Application.builder()
         .token(config.BOT_TOKEN)
         .request(request)
         .get_updates_request(HTTPXRequest(
-            connection_pool_size=8,
+            connection_pool_size=16,
             read_timeout=60.0,  # Long polling uchun uzunroq timeout
             write_timeout=30.0,
             connect_timeout=30.0,
             pool_timeout=30.0,
+            http_version="2",
         ))
         .post_init(post_init)
         .build()
@@ -227,49 +409,9 @@ async def main():
     application.add_handler(CommandHandler("config", cmd_check_config))
     
     application.add_handler(get_login_conversation_handler())
+    # Main menu and admin panel callbacks go through one dict-dispatched handler
     application.add_handler(
-        CallbackQueryHandler(handle_start_userbot, pattern="^start_userbot$")
-    )
-    application.add_handler(
-        CallbackQueryHandler(handle_wakeup_userbot, pattern="^wakeup_userbot$")
-    )
-    application.add_handler(
-        CallbackQueryHandler(handle_check_status, pattern="^check_status$")
-    )
-    application.add_handler(
-        CallbackQueryHandler(handle_logout, pattern="^logout$")
-    )
-    application.add_handler(
-        CallbackQueryHandler(handle_check_subscription, pattern="^check_subscription$")
-    )
-    
-    # Admin panel callbacks (OWNER only)
-    application.add_handler(
-        CallbackQueryHandler(handle_admin_config, pattern="^admin_config$")
-    )
-    application.add_handler(
-        CallbackQueryHandler(handle_admin_channels_view, pattern="^admin_channels_view")
-    )
-    application.add_handler(
-        CallbackQueryHandler(handle_admin_channels_manage, pattern="^admin_channels_manage")
-    )
-    application.add_handler(
-        CallbackQueryHandler(handle_admin_add_channel_info, pattern="^admin_add_channel_info$")
-    )
-    application.add_handler(
-        CallbackQueryHandler(handle_admin_remove_channel_info, pattern="^admin_remove_channel_info$")
-    )
-    application.add_handler(
-        CallbackQueryHandler(handle_admin_set_channel, pattern="^admin_set_channel$")
-    )
-    application.add_handler(
-        CallbackQueryHandler(handle_admin_remove_channel, pattern="^admin_remove_channel$")
-    )
-    application.add_handler(
-        CallbackQueryHandler(handle_channel_remove, pattern="^remove_channel_")
-    )
-    application.add_handler(
-        CallbackQueryHandler(handle_admin_refresh, pattern="^admin_refresh$")
+        CallbackQueryHandler(dispatch_callback, pattern=_CALLBACK_DISPATCH_RE)
     )
     
     # Admin text message handler for adding channels (OWNER only)
@@ -299,15 +441,8 @@ async def main():
     
     # Set menu button after bot starts
     try:
-        from telegram import BotCommand, MenuButtonCommands
-        commands = [
-            BotCommand("start", "Botni ishga tushirish va boshqaruv paneli"),
-            BotCommand("help", "Bot haqida ma'lumot va yordam"),
-            BotCommand("transcribe", "Audio/voice ni matnga aylantirish (Whisper AI)"),
-            BotCommand("audio2voice", "Audio faylni ovozli habarga aylantirish (FFmpeg)")
-        ]
-        await application.bot.set_my_commands(commands)
-        await application.bot.set_chat_menu_button(menu_button=MenuButtonCommands())
+        await application.bot.set_my_commands(_BOT_COMMANDS)
+        await application.bot.set_chat_menu_button(menu_button=_MENU_BUTTON)
         print("✅ Menu button sozlandi!")
     except Exception as e:
         print(f"⚠️ Menu button xatosi: {e}")
@@ -318,78 +453,45 @@ async def main():
         poll_interval=1.0,  # So'rovlar orasidagi vaqt
     )
     
-    # Keep running
+    # Keep running until SIGINT/SIGTERM
+    shutdown_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, shutdown_event.set)
+        except NotImplementedError:
+            # Windows: Ctrl+C still cancels main() via KeyboardInterrupt
+            pass
+    
     try:
-        while True:
-            await asyncio.sleep(1)
-    except asyncio.CancelledError:
+        await shutdown_event.wait()
+    finally:
         print("\n👋 Shutting down...")
-        # Cancel all userbot tasks
-        for user_id, task in userbot_tasks.items():
-            if task and not task.done():
-                task.cancel()
+        # Cancel all userbot tasks and let their disconnects run in parallel
+        pending = [task for task in userbot_tasks.values() if task and not task.done()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        # Stop the auto-sleep scheduler so it isn't destroyed while pending
+        if _sleep_scheduler is not None and not _sleep_scheduler.done():
+            _sleep_scheduler.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await _sleep_scheduler
+        await asyncio.gather(*(loader.teardown() for loader in userbot_loaders.values()))
+        userbot_loaders.clear()
         await application.updater.stop()
         await application.stop()
         await application.shutdown()
-        raise
+        await close_http_client()
 
 
 async def help_command(update: Update, context):
     """Handle /help command - show bot information and usage."""
-    help_text = """
-🤖 **Telethon Userbot Boshqaruv Tizimi**
-
-**Bot haqida:**
-Bu bot sizning Telegram akkauntingizga userbot ulash va boshqarish imkonini beradi. Userbot - bu sizning akkauntingiz orqali ishlaydigan va turli buyruqlarni bajaradigan maxsus dastur.
-
-**Asosiy imkoniyatlar:**
-• Akkauntni xavfsiz ulash (2FA qo'llab-quvvatlash bilan)
-• Userbotni ishga tushirish va boshqarish
-• Medialarni saqlash (.ok buyrug'i)
-• AI bilan suhbat (.ask buyrug'i)
-• Audio/voice transkript (bot va userbot)
-• Avtomatik uxlash rejimi
-
-**Qanday foydalanish:**
-
-1️⃣ **Akkaunt ulash:**
-   • /start buyrug'ini yuboring
-   • "🔗 Akkaunt ulash" tugmasini bosing
-   • Telefon raqamingizni kiriting
-   • Telegram'dan kelgan kodni kiriting
-   • Agar 2FA yoqilgan bo'lsa, parolingizni kiriting
-
-2️⃣ **Userbotni ishga tushirish:**
-   • Akkaunt ulanganidan keyin
-   • "🚀 Userbot ishga tushirish" tugmasini bosing
-   • Userbot fonda ishlaydi
-
-3️⃣ **Userbot buyruqlari:**
-   • `.ok` - Mediaga javob berib saqlash (Saqlangan Xabarlarga)
-   • `.ask <savol>` - AI dan so'rash (javob o'sha chatda)
-   • `.transcribe` - Audio/voice/video ni matnga (Whisper AI)
-   • `.help` - Barcha buyruqlarni ko'rish
-
-4️⃣ **Bot buyruqlari:**
-   • /transcribe - Audio transkript ma'lumotini olish
-   • Audio yuborish - Botga to'g'ridan-to'g'ri audio/voice yuborsangiz avtomatik matnga aylanadi
-
-**Xavfsizlik:**
-✅ Faqat siz o'z userbotingizni boshqarasiz
-✅ Buyruqlar avtomatik o'chiriladi
-✅ `.ok` javoblari Saqlangan Xabarlarga boradi
-
-**Yordam kerakmi?**
-Muammo bo'lsa, /start bosib qaytadan urinib ko'ring.
-"""
-    
-    await update.message.reply_text(help_text, parse_mode="Markdown")
+    await update.message.reply_text(HELP_TEXT, parse_mode="Markdown")
 
 
 async def handle_start_userbot(update: Update, context):
     """Handle start userbot button - starts userbot for this user."""
-    from bot.handlers import check_subscription, get_subscription_keyboard
-    
     query = update.callback_query
     await query.answer()
     
@@ -398,12 +500,8 @@ async def handle_start_userbot(update: Update, context):
     # Check subscription
     is_subscribed, missing_channels = await check_subscription(context.bot, user_id)
     if not is_subscribed:
-        channels_text = "\n".join([f"• {ch}" for ch in missing_channels])
         await query.edit_message_text(
-            f"⚠️ <b>Obuna talab qilinadi!</b>\n\n"
-            f"Botdan foydalanish uchun avval kanallarga obuna bo'ling:\n\n"
-            f"{channels_text}\n\n"
-            f"Obuna bo'lgandan so'ng \"✅ Obunani tekshirish\" tugmasini bosing.",
+            _subscribe_prompt(tuple(missing_channels)),
             parse_mode="HTML",
             reply_markup=get_subscription_keyboard(missing_channels)
         )
@@ -423,21 +521,13 @@ async def handle_start_userbot(update: Update, context):
     await start_userbot_for_user_background(user_id)
     
     await query.message.reply_text(
-        "✅ **Userbotingiz ishlamoqda!**\n\n"
-        "📱 **Buyruqlar:**\n"
-        "• `.ok` - Media saqlash\n"
-        "• `.ask <savol>` - AI suhbat\n"
-        "• `.transcribe` - Audio → Text\n"
-        "• `.help` - To'liq qo'llanma\n\n"
-        "🎙️ **Whisper AI:** Har qanday til, har qanday format",
+        USERBOT_STARTED_TEXT,
         parse_mode="Markdown"
     )
 
 
 async def handle_wakeup_userbot(update: Update, context):
     """Handle wake up button - restarts the userbot for this user."""
-    from bot.handlers import check_subscription, get_subscription_keyboard
-    
     query = update.callback_query
     await query.answer()
     
@@ -446,12 +536,8 @@ async def handle_wakeup_userbot(update: Update, context):
     # Check subscription
     is_subscribed, missing_channels = await check_subscription(context.bot, user_id)
     if not is_subscribed:
-        channels_text = "\n".join([f"• {ch}" for ch in missing_channels])
         await query.edit_message_text(
-            f"⚠️ <b>Obuna talab qilinadi!</b>\n\n"
-            f"Botdan foydalanish uchun avval kanallarga obuna bo'ling:\n\n"
-            f"{channels_text}\n\n"
-            f"Obuna bo'lgandan so'ng \"✅ Obunani tekshirish\" tugmasini bosing.",
+            _subscribe_prompt(tuple(missing_channels)),
             parse_mode="HTML",
             reply_markup=get_subscription_keyboard(missing_channels)
         )
@@ -467,32 +553,25 @@ async def handle_wakeup_userbot(update: Update, context):
     
     global userbot_tasks
     
-    # Cancel existing task for this user
-    if user_id in userbot_tasks and not userbot_tasks[user_id].done():
-        userbot_tasks[user_id].cancel()
-        try:
-            await userbot_tasks[user_id]
-        except asyncio.CancelledError:
-            # Task was cancelled successfully, continue with cleanup
-            print(f"✅ Userbot task for user {user_id} cancelled successfully")
-            raise
-        await asyncio.sleep(1)
+    # Cancel existing task for this user and wait until it has disconnected
+    task = userbot_tasks.get(user_id)
+    if task is not None and not task.done():
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+        logger.info(f"✅ Userbot task for user {user_id} cancelled successfully")
     
     # Start fresh for this user
     await start_userbot_for_user_background(user_id)
     
     await query.message.reply_text(
-        "✅ **Userbotingiz qayta ishladi!**\n\n"
-        "Endi ishlashi kerak.\n"
-        "Sinash uchun `.help` yozing.",
+        USERBOT_RESTARTED_TEXT,
         parse_mode="Markdown"
     )
 
 
 async def handle_check_status(update: Update, context):
     """Handle status check button for this user."""
-    from bot.handlers import check_subscription, get_subscription_keyboard
-    
     query = update.callback_query
     await query.answer()
     
@@ -501,12 +580,8 @@ async def handle_check_status(update: Update, context):
     # Check subscription
     is_subscribed, missing_channels = await check_subscription(context.bot, user_id)
     if not is_subscribed:
-        channels_text = "\n".join([f"• {ch}" for ch in missing_channels])
         await query.edit_message_text(
-            f"⚠️ <b>Obuna talab qilinadi!</b>\n\n"
-            f"Botdan foydalanish uchun avval kanallarga obuna bo'ling:\n\n"
-            f"{channels_text}\n\n"
-            f"Obuna bo'lgandan so'ng \"✅ Obunani tekshirish\" tugmasini bosing.",
+            _subscribe_prompt(tuple(missing_channels)),
             parse_mode="HTML",
             reply_markup=get_subscription_keyboard(missing_channels)
         )
@@ -541,16 +616,13 @@ async def handle_check_status(update: Update, context):
 
 async def handle_check_subscription(update: Update, context):
     """Handle subscription check callback."""
-    from bot.handlers import check_subscription, get_subscription_keyboard
-    from telegram.error import BadRequest
-    
     query = update.callback_query
     await query.answer()
     
     user_id = update.effective_user.id
     
-    # Check all required channels
-    is_subscribed, missing_channels = await check_subscription(context.bot, user_id)
+    # Check all required channels (skip the cache - user asked to re-check)
+    is_subscribed, missing_channels = await check_subscription(context.bot, user_id, fresh=True)
     
     try:
         if is_subscribed:
@@ -577,8 +649,6 @@ async def handle_check_subscription(update: Update, context):
 
 async def handle_logout(update: Update, context):
     """Handle logout button - removes user session completely."""
-    from bot.handlers import check_subscription, get_subscription_keyboard
-    
     query = update.callback_query
     await query.answer()
     
@@ -587,19 +657,13 @@ async def handle_logout(update: Update, context):
     # Check subscription
     is_subscribed, missing_channels = await check_subscription(context.bot, user_id)
     if not is_subscribed:
-        channels_text = "\n".join([f"• {ch}" for ch in missing_channels])
         await query.edit_message_text(
-            f"⚠️ <b>Obuna talab qilinadi!</b>\n\n"
-            f"Botdan foydalanish uchun avval kanallarga obuna bo'ling:\n\n"
-            f"{channels_text}\n\n"
-            f"Obuna bo'lgandan so'ng \"✅ Obunani tekshirish\" tugmasini bosing.",
+            _subscribe_prompt(tuple(missing_channels)),
             parse_mode="HTML",
             reply_markup=get_subscription_keyboard(missing_channels)
         )
         return
     
-    session_path = get_user_session_path(user_id)
-    
     global userbot_tasks, userbot_clients
     
     await query.edit_message_text("⏳ Chiqish amalga oshirilmoqda...")
@@ -610,38 +674,39 @@ async def handle_logout(update: Update, context):
             client = userbot_clients[user_id]
             if client.is_connected():
                 await client.disconnect()
-            del userbot_clients[user_id]
         except Exception:
             pass
+        userbot_clients.pop(user_id, None)
     
-    # Then cancel the task
-    if user_id in userbot_tasks:
-        try:
-            userbot_tasks[user_id].cancel()
-            await asyncio.sleep(1)  # Wait for task to finish
-        except Exception:
-            pass
-        if user_id in userbot_tasks:
-            del userbot_tasks[user_id]
+    # Close the per-user module resources (HTTP sessions)
+    loader = userbot_loaders.pop(user_id, None)
+    if loader is not None:
+        await loader.teardown()
     
-    # Wait a bit for file to be released
-    await asyncio.sleep(1)
+    # Then cancel the task and wait for it (its done callback removes it from the dicts)
+    task = userbot_tasks.get(user_id)
+    if task is not None:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError, Exception):
+            await task
     
     # Delete session file
-    if os.path.exists(session_path):
-        try:
-            os.remove(session_path)
-            await query.message.reply_text(
-                "✅ **Muvaffaqiyatli chiqildi!**\n\n"
-                "Sizning sessiyangiz o'chirildi.\n"
-                "Qayta ulash uchun /start bosing.",
-                parse_mode="Markdown"
-            )
-        except Exception as e:
-            await query.message.reply_text(
-                f"❌ Sessiyani o'chirishda xatolik: {e}\n\n"
-                "Iltimos, botni qayta ishga tushiring va qaytadan urinib ko'ring.",
-            )
+    try:
+        deleted = await _remove_session_file(user_id)
+    except Exception as e:
+        await query.message.reply_text(
+            f"❌ Sessiyani o'chirishda xatolik: {e}\n\n"
+            "Iltimos, botni qayta ishga tushiring va qaytadan urinib ko'ring.",
+        )
+        return
+    
+    if deleted:
+        await query.message.reply_text(
+            "✅ **Muvaffaqiyatli chiqildi!**\n\n"
+            "Sizning sessiyangiz o'chirildi.\n"
+            "Qayta ulash uchun /start bosing.",
+            parse_mode="Markdown"
+        )
     else:
         await query.message.reply_text(
             "⚠️ Sessiya topilmadi.\n\n"
@@ -649,14 +714,59 @@ async def handle_logout(update: Update, context):
         )
 
 
+# callback_data -> handler for buttons without a parameter suffix
+CALLBACK_DISPATCH = {
+    "start_userbot": handle_start_userbot,
+    "wakeup_userbot": handle_wakeup_userbot,
+    "check_status": handle_check_status,
+    "logout": handle_logout,
+    "check_subscription": handle_check_subscription,
+    # Admin panel (OWNER only)
+    "admin_config": handle_admin_config,
+    "admin_add_channel_info": handle_admin_add_channel_info,
+    "admin_remove_channel_info": handle_admin_remove_channel_info,
+    "admin_set_channel": handle_admin_set_channel,
+    "admin_remove_channel": handle_admin_remove_channel,
+    "admin_refresh": handle_admin_refresh,
+}
+# callback_data prefix -> handler for buttons carrying a parameter (OWNER only)
+CALLBACK_PREFIX = {
+    "remove_channel_": handle_channel_remove,
+    "admin_channels_view": handle_admin_channels_view,
+    "admin_channels_manage": handle_admin_channels_manage,
+}
+_CALLBACK_DISPATCH_RE = re.compile(
+    "^(?:" + "|".join(map(re.escape, CALLBACK_DISPATCH)) + ")$"
+    "|^(?:" + "|".join(map(re.escape, CALLBACK_PREFIX)) + ")"
+)
+
+
+async def dispatch_callback(update: Update, context):
+    """Route a callback query to its handler: exact match first, then prefix."""
+    data = update.callback_query.data
+    handler = CALLBACK_DISPATCH.get(data)
+    if handler is None:
+        handler = next(fn for prefix, fn in CALLBACK_PREFIX.items() if data.startswith(prefix))
+    await handler(update, context)
+
+
 if __name__ == "__main__":
     # Validate configuration
     if not config.validate():
         print("❌ Configuration error! Check your .env file.")
         sys.exit(1)
     
+    # libuv-based event loop (not available on Windows)
+    run = asyncio.run
+    if sys.platform != "win32":
+        try:
+            import uvloop
+            run = uvloop.run
+        except ImportError:
+            pass
+    
     try:
-        asyncio.run(main())
+        run(main())
     except KeyboardInterrupt:
         print("\n👋 Stopped by user.")
     except Exception as e:
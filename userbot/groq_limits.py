@@ -0,0 +1,104 @@
+"""
+Process-wide Groq rate limiting, retry backoff and concurrency caps.
+Userbot modules are executed once per user and the bot runs in the same
+process, so anything tied to the single GROQ_API_KEY lives here, in a
+normally imported module, to be shared by all of them.
+"""
+
+import re
+import time
+import random
+import asyncio
+from collections import deque
+from typing import Optional
+
+
+# Groq limits for the API key (sliding 60 s window, shared by every userbot)
+REQUESTS_PER_MINUTE = 20
+TOKENS_PER_MINUTE = 200_000
+RATE_WINDOW = 60.0
+
+# At most this many .transcribe uploads to Groq in flight at once, across
+# all users (request rate is left to groq_limiter)
+MAX_CONCURRENT_TRANSCRIPTIONS = 4
+
+# Retry backoff for transient Groq errors (429 / 5xx / network)
+BASE_DELAY = 1.0
+MAX_DELAY = 32.0
+JITTER = 0.5
+
+# Groq reset headers look like "2m59.56s" or "120ms"
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+
+def _parse_duration(value: str) -> float:
+    """Convert a Groq duration string to seconds."""
+    return sum(float(num) * _DURATION_UNITS[unit] for num, unit in _DURATION_RE.findall(value))
+
+
+def backoff_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    """Delay before the next retry: Retry-After if given, else exponential + jitter."""
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return min(MAX_DELAY, BASE_DELAY * 2 ** attempt) + random.random() * JITTER
+
+
+class GroqRateLimiter:
+    """
+    Proactive sliding-window limiter plus reactive x-ratelimit-* header handling.
+    Waits before a request instead of letting Groq answer with 429.
+    """
+    
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests: deque = deque()  # timestamps
+        self._tokens: deque = deque()    # (timestamp, tokens)
+        self._token_total = 0
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+    
+    def _prune(self, now: float):
+        cutoff = now - RATE_WINDOW
+        while self._requests and self._requests[0] <= cutoff:
+            self._requests.popleft()
+        while self._tokens and self._tokens[0][0] <= cutoff:
+            self._token_total -= self._tokens.popleft()[1]
+    
+    async def wait_if_throttled(self, est_tokens: int):
+        """Sleep until one more request of est_tokens fits in the window."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._prune(now)
+                delay = self._blocked_until - now
+                if len(self._requests) >= self.requests_per_minute:
+                    delay = max(delay, self._requests[0] + RATE_WINDOW - now)
+                if self._tokens and self._token_total + est_tokens > self.tokens_per_minute:
+                    delay = max(delay, self._tokens[0][0] + RATE_WINDOW - now)
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+            self._requests.append(now)
+            self._tokens.append((now, est_tokens))
+            self._token_total += est_tokens
+    
+    def update(self, headers):
+        """Block until the reset time once Groq reports the quota is spent."""
+        for kind in ("requests", "tokens"):
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            if remaining and remaining.isdigit() and int(remaining) < 1:
+                reset = _parse_duration(headers.get(f"x-ratelimit-reset-{kind}", ""))
+                self._blocked_until = max(self._blocked_until, time.monotonic() + reset)
+    
+    def block_for(self, seconds: float):
+        """Hold every request back for the given time (after a 429)."""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+
+groq_limiter = GroqRateLimiter(REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE)
+transcribe_semaphore = asyncio.Semaphore(MAX_CONCURRENT_TRANSCRIPTIONS)
@@ -6,16 +6,36 @@ Provides a clean interface for registering command handlers.
 
 import os
 import sys
+import asyncio
 import importlib
 import importlib.util
-from typing import Dict, List, Callable, Any, Optional
+from typing import Dict, List, Callable, Any, Optional, Tuple
+from types import CodeType, ModuleType
+from concurrent.futures import ThreadPoolExecutor
 from telethon import TelegramClient, events
 
-# Add parent directory to path
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import config
 
 
+# Upper bound on threads used to execute module bodies at startup
+MAX_LOAD_WORKERS = 8
+
+# Compiled module code shared by every userbot: path -> (mtime_ns, code)
+_code_cache: Dict[str, Tuple[int, CodeType]] = {}
+
+
+def _get_module_code(module_path: str) -> CodeType:
+    """Return compiled code for a module file, compiling only when it changed."""
+    mtime_ns = os.stat(module_path).st_mtime_ns
+    cached = _code_cache.get(module_path)
+    if cached is not None and cached[0] == mtime_ns:
+        return cached[1]
+    with open(module_path, "rb") as f:
+        code = compile(f.read(), module_path, "exec")
+    _code_cache[module_path] = (mtime_ns, code)
+    return code
+
+
 class ModuleInfo:
     """Stores information about a loaded module."""
     
@@ -44,56 +64,134 @@ class ModuleLoader:
         self.owner_id = owner_id  # This user's ID
         self.modules: Dict[str, ModuleInfo] = {}
         self.modules_path = os.path.join(os.path.dirname(__file__), "modules")
+        # Executed module objects, kept so their teardown() hooks can run
+        self._module_objects: Dict[str, ModuleType] = {}
+        # Set whenever the module set changes so cached help text is rebuilt
+        self._help_dirty = True
         
     def load_all_modules(self) -> int:
         """
         Load all modules from the modules directory.
+        Blocks the calling thread; inside a running event loop use
+        load_all_modules_async instead.
+        
+        Returns:
+            Number of modules successfully loaded
+        """
+        candidates = self._find_modules()
+        if not candidates:
+            return 0
+        
+        # Execute module bodies (imports, disk reads) in parallel...
+        with ThreadPoolExecutor(max_workers=min(MAX_LOAD_WORKERS, len(candidates))) as executor:
+            results = list(executor.map(self._exec_guarded, candidates))
+        
+        # ...then run setup() on the calling thread, where handlers are registered
+        return self._setup_all(candidates, results)
+    
+    async def load_all_modules_async(self) -> int:
+        """
+        Load all modules from a running event loop.
+        Module bodies execute in the default executor; setup() and handler
+        registration run on the loop thread.
         
         Returns:
             Number of modules successfully loaded
         """
+        candidates = await asyncio.to_thread(self._find_modules)
+        if not candidates:
+            return 0
+        
+        results = await asyncio.gather(
+            *(asyncio.to_thread(self._exec_guarded, candidate) for candidate in candidates)
+        )
+        return self._setup_all(candidates, results)
+    
+    def _find_modules(self) -> List[Tuple[str, str]]:
+        """List (module_name, path) for every module file in one scandir pass."""
         if not os.path.exists(self.modules_path):
             os.makedirs(self.modules_path)
-            return 0
+            return []
         
+        candidates: List[Tuple[str, str]] = []
+        with os.scandir(self.modules_path) as entries:
+            for entry in entries:
+                name = entry.name
+                if not name.endswith(".py") or name.startswith("_"):
+                    continue
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                candidates.append((name[:-3], entry.path))  # Remove .py extension
+        return candidates
+    
+    def _setup_all(self, candidates: List[Tuple[str, str]], results) -> int:
+        """Run setup() for each executed module, in directory order."""
         loaded_count = 0
-        
-        # Get all Python files in modules directory
-        for filename in os.listdir(self.modules_path):
-            if filename.endswith(".py") and not filename.startswith("_"):
-                module_name = filename[:-3]  # Remove .py extension
-                
-                try:
-                    if self.load_module(module_name):
-                        loaded_count += 1
-                except Exception as e:
-                    print(f"⚠️ Failed to load module '{module_name}': {e}")
+        for (module_name, _), (module, error) in zip(candidates, results):
+            if error is not None:
+                print(f"⚠️ Failed to load module '{module_name}': {error}")
+                continue
+            if module is None:
+                continue
+            try:
+                if self._setup_module(module_name, module):
+                    loaded_count += 1
+            except Exception as e:
+                print(f"⚠️ Failed to load module '{module_name}': {e}")
         
         return loaded_count
     
-    def load_module(self, module_name: str) -> bool:
+    def load_module(self, module_name: str, module_path: Optional[str] = None) -> bool:
         """
         Load a specific module by name.
         
         Args:
             module_name: Name of the module to load (without .py extension)
+            module_path: Path to the module file, if already known (skips the
+                existence check)
             
         Returns:
             True if loaded successfully, False otherwise
         """
-        module_path = os.path.join(self.modules_path, f"{module_name}.py")
+        if module_path is None:
+            module_path = os.path.join(self.modules_path, f"{module_name}.py")
+            if not os.path.exists(module_path):
+                return False
         
-        if not os.path.exists(module_path):
+        module = self._exec_module(module_name, module_path)
+        if module is None:
             return False
+        return self._setup_module(module_name, module)
+    
+    def _exec_guarded(self, candidate: Tuple[str, str]) -> Tuple[Optional[ModuleType], Optional[Exception]]:
+        """Worker-thread wrapper around _exec_module that returns errors instead of raising."""
+        try:
+            return self._exec_module(*candidate), None
+        except Exception as e:
+            return None, e
+    
+    def _exec_module(self, module_name: str, module_path: str) -> Optional[ModuleType]:
+        """Create a fresh module object and execute the module body.
         
-        # Load the module
+        Safe to run from several threads: the module is only published in
+        sys.modules once its body has finished, so a sibling that imports it
+        (e.g. utils) either gets a complete copy or goes through the regular,
+        import-locked import machinery.
+        """
         spec = importlib.util.spec_from_file_location(module_name, module_path)
         if spec is None or spec.loader is None:
-            return False
+            return None
             
+        # Each loader gets a fresh module object (modules keep per-client
+        # globals), but the compiled code is shared across loaders
         module = importlib.util.module_from_spec(spec)
+        exec(_get_module_code(module_path), module.__dict__)
         sys.modules[f"userbot.modules.{module_name}"] = module
-        spec.loader.exec_module(module)
+        return module
+    
+    def _setup_module(self, module_name: str, module: ModuleType) -> bool:
+        """Call the module's setup() and record its info (must run on the loop thread)."""
+        self._module_objects[module_name] = module
         
         # Check if module has setup function
         if hasattr(module, "setup"):
@@ -102,6 +200,7 @@ class ModuleLoader:
             
             if isinstance(module_info, ModuleInfo):
                 self.modules[module_name] = module_info
+                self._help_dirty = True
                 return True
         
         # If no setup function, just register the module
@@ -109,9 +208,25 @@ class ModuleLoader:
             name=module_name,
             description=getattr(module, "__doc__", "No description")
         )
+        self._help_dirty = True
         
         return True
     
+    async def teardown(self):
+        """
+        Call every loaded module's optional teardown() hook (closes shared
+        HTTP sessions etc.). Call on logout and shutdown.
+        """
+        for module_name, module in self._module_objects.items():
+            hook = getattr(module, "teardown", None)
+            if hook is None:
+                continue
+            try:
+                await hook()
+            except Exception as e:
+                print(f"⚠️ Teardown failed for module '{module_name}': {e}")
+        self._module_objects.clear()
+    
     def register_handler(self, handler: Any, module_info: ModuleInfo):
         """
         Register an event handler and associate it with a module.
@@ -123,6 +238,18 @@ class ModuleLoader:
         self.client.add_event_handler(handler)
         module_info.handlers.append(handler)
     
+    def consume_help_dirty(self) -> bool:
+        """
+        Report whether the module set changed since the last call, and reset
+        the flag (used by .help to know when to rebuild its cached text).
+        
+        Returns:
+            True if help text built before this call is stale
+        """
+        dirty = self._help_dirty
+        self._help_dirty = False
+        return dirty
+    
     def get_all_modules(self) -> Dict[str, ModuleInfo]:
         """
         Get all loaded modules.
@@ -145,21 +272,30 @@ class ModuleLoader:
         return self.modules.get(name)
 
 
-def owner_only(func: Callable) -> Callable:
+def owner_only(func: Callable = None, *, owner: int = None) -> Callable:
     """
     Decorator to restrict command to owner only.
     Silently ignores commands from non-owners.
     
+    The owner ID is bound when decorating, so the wrapper does a plain
+    integer compare per event. Use as @owner_only (config.OWNER_ID) or
+    @owner_only(owner=user_id).
+    
     Args:
         func: The handler function to wrap
+        owner: Owner user ID (defaults to config.OWNER_ID)
         
     Returns:
         Wrapped function that checks owner
     """
+    if func is None:
+        return lambda f: owner_only(f, owner=owner)
+    
+    owner_id = config.OWNER_ID if owner is None else owner
+    
     async def wrapper(event):
         # Check if sender is the owner
-        sender_id = event.sender_id
-        if sender_id != config.OWNER_ID:
+        if event.sender_id != owner_id:
             return  # Silently ignore
         
         return await func(event)
@@ -200,6 +336,33 @@ def auto_delete(func: Callable) -> Callable:
     return wrapper
 
 
+def command_filter(name: str, has_args: bool = False) -> Callable[[Any], bool]:
+    """
+    Build a NewMessage func= predicate for a command.
+    
+    Matching uses plain string comparison instead of a regex, since this
+    runs for every outgoing message and most of them are not commands.
+    
+    Args:
+        name: Command name without prefix, e.g. "help"
+        has_args: Also match the command followed by whitespace and arguments
+        
+    Returns:
+        Predicate taking the event and returning True for this command
+    """
+    command = f"{config.CMD_PREFIX}{name}"
+    size = len(command)
+    
+    if not has_args:
+        return lambda event: event.raw_text == command
+    
+    def match(event) -> bool:
+        text = event.raw_text
+        return text.startswith(command) and (len(text) == size or text[size].isspace())
+    
+    return match
+
+
 def command(pattern: str, owner: bool = True, delete: bool = True):
     """
     Decorator factory for creating command handlers.
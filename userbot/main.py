@@ -97,7 +97,7 @@ class Userbot:
         self.loader = ModuleLoader(self.client)
         
         # Load all modules
-        loaded = self.loader.load_all_modules()
+        loaded = await self.loader.load_all_modules_async()
         print(f"📦 Loaded {loaded} module(s)")
         
         # List loaded modules
@@ -131,6 +131,9 @@ class Userbot:
         print("\n👋 Stopping userbot...")
         if self.client:
             await self.client.disconnect()
+        # Let modules close their shared HTTP sessions
+        if self.loader:
+            await self.loader.teardown()
         print("✅ Userbot stopped.")
 
 
@@ -150,8 +153,17 @@ def main():
     # Create and run userbot
     userbot = Userbot()
     
+    # libuv-based event loop (not available on Windows)
+    run = asyncio.run
+    if sys.platform != "win32":
+        try:
+            import uvloop
+            run = uvloop.run
+        except ImportError:
+            pass
+    
     try:
-        asyncio.run(userbot.run())
+        run(userbot.run())
     except KeyboardInterrupt:
         print("\n👋 Stopped by user.")
     except Exception as e:
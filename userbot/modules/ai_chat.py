@@ -4,24 +4,66 @@ Integrates with Groq API for AI-powered responses using Llama 3 70B.
 Supports context from replied messages.
 """
 
-import os
-import sys
 import asyncio
 import aiohttp
+import orjson
 from typing import Optional
 
 from telethon import TelegramClient, events
 from telethon.tl.types import Message
 
-# Add parent directory to path
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 from config import config
-from userbot.loader import ModuleInfo
+from userbot.loader import ModuleInfo, command_filter
+from userbot.modules.utils import truncate_text, truncate_to_tg
 
 
+# Command matcher (string compare, no regex)
+ASK_FILTER = command_filter("ask", has_args=True)
+
+# Static Groq message templates (shared across calls, never mutated)
+_SYSTEM_MSG = {
+    "role": "system",
+    "content": (
+        "You are a helpful AI assistant. Provide clear, concise, and accurate responses. "
+        "If given context from a previous message, use it to inform your answer. "
+        "Keep responses focused and avoid unnecessary verbosity."
+    )
+}
+_CONTEXT_ACK = {
+    "role": "assistant",
+    "content": "I've noted the context. What would you like to know about it?"
+}
+
 # Store client reference
 _client: TelegramClient = None
 
+# Shared HTTP session for Groq (keeps the TLS connection alive between .ask calls)
+_session: Optional[aiohttp.ClientSession] = None
+
+
+async def _get_session() -> aiohttp.ClientSession:
+    """Get (or lazily create) the shared aiohttp session."""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=10, ttl_dns_cache=300, keepalive_timeout=60),
+            timeout=aiohttp.ClientTimeout(total=60)
+        )
+    return _session
+
+
+async def close_session():
+    """Close the shared aiohttp session (call on shutdown)."""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+async def teardown():
+    """Loader shutdown hook: release this userbot's HTTP session."""
+    await close_session()
+
 
 async def query_groq(prompt: str, context: Optional[str] = None) -> str:
     """
@@ -37,18 +79,8 @@ async def query_groq(prompt: str, context: Optional[str] = None) -> str:
     if not config.GROQ_API_KEY:
         return "❌ Groq API kaliti sozlanmagan. .env fayliga GROQ_API_KEY qo'shing."
     
-    # Build messages array
-    messages = []
-    
-    # System message for behavior
-    messages.append({
-        "role": "system",
-        "content": (
-            "You are a helpful AI assistant. Provide clear, concise, and accurate responses. "
-            "If given context from a previous message, use it to inform your answer. "
-            "Keep responses focused and avoid unnecessary verbosity."
-        )
-    })
+    # Build messages array from the static templates
+    messages = [_SYSTEM_MSG]
     
     # Add context if provided
     if context:
@@ -56,16 +88,10 @@ async def query_groq(prompt: str, context: Optional[str] = None) -> str:
             "role": "user",
             "content": f"Context from previous message:\n\n{context}"
         })
-        messages.append({
-            "role": "assistant",
-            "content": "I've noted the context. What would you like to know about it?"
-        })
+        messages.append(_CONTEXT_ACK)
     
     # Add the actual prompt
-    messages.append({
-        "role": "user",
-        "content": prompt
-    })
+    messages.append({"role": "user", "content": prompt})
     
     # Prepare request
     headers = {
@@ -82,23 +108,22 @@ async def query_groq(prompt: str, context: Optional[str] = None) -> str:
     }
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                config.GROQ_API_URL,
-                headers=headers,
-                json=payload,
-                timeout=aiohttp.ClientTimeout(total=60)
-            ) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return data["choices"][0]["message"]["content"]
-                elif response.status == 401:
-                    return "❌ Groq API kaliti noto'g'ri. Sozlamalarni tekshiring."
-                elif response.status == 429:
-                    return "❌ So'rovlar limiti oshdi. Keyinroq urinib ko'ring."
-                else:
-                    error_text = await response.text()
-                    return f"❌ API xatosi ({response.status}): {error_text[:200]}"
+        session = await _get_session()
+        async with session.post(
+            config.GROQ_API_URL,
+            headers=headers,
+            data=orjson.dumps(payload)
+        ) as response:
+            if response.status == 200:
+                data = orjson.loads(await response.read())
+                return data["choices"][0]["message"]["content"]
+            elif response.status == 401:
+                return "❌ Groq API kaliti noto'g'ri. Sozlamalarni tekshiring."
+            elif response.status == 429:
+                return "❌ So'rovlar limiti oshdi. Keyinroq urinib ko'ring."
+            else:
+                error_text = await response.text()
+                return f"❌ API xatosi ({response.status}): {error_text[:200]}"
                     
     except asyncio.TimeoutError:
         return "❌ So'rov vaqti tugadi. Qaytadan urinib ko'ring."
@@ -113,8 +138,6 @@ async def ask_handler(event):
     Handler for .ask command.
     Queries Groq AI and sends response to the same chat.
     """
-    from userbot.modules.utils import truncate_text
-    
     # Extract the prompt from the command
     message_text = event.raw_text
     
@@ -176,7 +199,8 @@ async def ask_handler(event):
         response
     ])
     
-    output = "\n".join(output_parts)
+    # Prompt and context add to the 4000-char answer, so cap the whole message
+    output = truncate_to_tg("\n".join(output_parts))
     
     # Send response to the same chat where command was used
     await event.respond(output)
@@ -212,17 +236,11 @@ def setup(client: TelegramClient, loader) -> ModuleInfo:
         print("   ⚠️ AI Suhbat: GROQ_API_KEY sozlanmagan")
     
     # Create the event handler
-    @client.on(events.NewMessage(pattern=r"^\.ask(\s|$)", outgoing=True))
+    @client.on(events.NewMessage(outgoing=True, from_users=owner_id or None, func=ASK_FILTER))
     async def ask_event_handler(event):
-        """Handler wrapper with owner verification."""
-        # Only respond to this userbot's owner
-        if owner_id and event.sender_id != owner_id:
-            return
-        
-        # Don't delete in Saved Messages
-        is_saved_messages = event.chat_id == event.sender_id
-        
-        if not is_saved_messages:
+        """Handler wrapper (non-owner messages are filtered out by from_users)."""
+        # Don't delete in Saved Messages (its chat id is the owner's own id)
+        if event.chat_id != (owner_id or event.sender_id):
             try:
                 # Delete the command message (stealth) - only in other chats
                 await event.delete()
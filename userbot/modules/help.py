@@ -4,22 +4,23 @@ Displays a list of all loaded modules and their commands.
 The help message auto-deletes after a configurable delay.
 """
 
-import os
-import sys
 import asyncio
 
 from telethon import TelegramClient, events
 from telethon.tl.types import Message
 
-# Add parent directory to path
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 from config import config
-from userbot.loader import ModuleInfo
+from userbot.loader import ModuleInfo, command_filter
 
 
+# Command matcher (string compare, no regex)
+HELP_FILTER = command_filter("help")
+
 # Store references
 _client: TelegramClient = None
 _loader = None
+# Help text built from the loaded modules (rebuilt when the loader marks it dirty)
+_cached_help: str = None
 
 
 async def help_handler(event):
@@ -27,18 +28,26 @@ async def help_handler(event):
     Handler for .help command.
     Shows all loaded modules and their commands.
     """
+    global _cached_help
     if _loader is None:
         return
     
-    # Build help message
+    # Always consume the flag so a change seen now isn't rebuilt twice
+    if _loader.consume_help_dirty() or _cached_help is None:
+        _cached_help = _build_help_text(_loader.get_all_modules())
+    
+    # Send help message to Saved Messages
+    await _client.send_message("me", _cached_help)
+
+
+def _build_help_text(modules: dict) -> str:
+    """Build the help message for the given loaded modules."""
     help_text_parts = [
         "🤖 **Userbot Yordam**",
         "━" * 20,
         ""
     ]
     
-    modules = _loader.get_all_modules()
-    
     for name, info in modules.items():
         if info.commands:
             commands_str = " | ".join([f"`.{cmd}`" for cmd in info.commands])
@@ -59,10 +68,7 @@ async def help_handler(event):
         "`.help` - Ushbu yordam",
     ])
     
-    help_text = "\n".join(help_text_parts)
-    
-    # Send help message to Saved Messages
-    await _client.send_message("me", help_text)
+    return "\n".join(help_text_parts)
 
 
 def setup(client: TelegramClient, loader) -> ModuleInfo:
@@ -92,17 +98,11 @@ def setup(client: TelegramClient, loader) -> ModuleInfo:
     )
     
     # Create the event handler
-    @client.on(events.NewMessage(pattern=r"^\.help$", outgoing=True))
+    @client.on(events.NewMessage(outgoing=True, from_users=owner_id or None, func=HELP_FILTER))
     async def help_event_handler(event):
-        """Handler wrapper with owner verification."""
-        # Only respond to this userbot's owner
-        if owner_id and event.sender_id != owner_id:
-            return
-        
-        # Don't delete in Saved Messages
-        is_saved_messages = event.chat_id == event.sender_id
-        
-        if not is_saved_messages:
+        """Handler wrapper (non-owner messages are filtered out by from_users)."""
+        # Don't delete in Saved Messages (its chat id is the owner's own id)
+        if event.chat_id != (owner_id or event.sender_id):
             try:
                 # Delete the command message (stealth) - only in other chats
                 await event.delete()
@@ -5,19 +5,36 @@ Only works when replying to a message containing media.
 """
 
 import os
-import sys
+import io
 import asyncio
+import logging
 from datetime import datetime
 
 from telethon import TelegramClient, events
 from telethon.tl.types import Message
 
-# Add parent directory to path
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 from config import config
-from userbot.loader import ModuleInfo, command
+from userbot.loader import ModuleInfo, command, command_filter
+from userbot.modules.utils import (
+    has_media,
+    get_media_type,
+    get_filename,
+    download_media,
+    send_to_saved_messages,
+    cleanup_temp_file,
+    format_file_size,
+    is_view_once,
+)
 
 
+logger = logging.getLogger(__name__)
+
+# Media up to this size is kept in memory instead of a temp file
+MAX_IN_MEMORY_SIZE = 50 * 1024 * 1024
+
+# Command matcher (string compare, no regex)
+OK_FILTER = command_filter("ok")
+
 # Store client reference for handlers
 _client: TelegramClient = None
 
@@ -27,18 +44,6 @@ async def save_media_handler(event):
     Handler for .ok command.
     Downloads media from replied message and sends to Saved Messages.
     """
-    # Import utils here to avoid circular imports
-    from userbot.modules.utils import (
-        has_media,
-        get_media_type,
-        get_filename,
-        download_media,
-        send_to_saved_messages,
-        cleanup_temp_file,
-        format_file_size,
-        is_view_once,
-    )
-    
     # Check if this is a reply
     reply = await event.get_reply_message()
     
@@ -54,18 +59,38 @@ async def save_media_handler(event):
     media_type = get_media_type(reply)
     is_disappearing = is_view_once(reply)
     
-    # Download the media
-    filepath = await download_media(_client, reply)
+    # Download the media - small files stay in memory (no temp file round-trip)
+    filepath = None
+    expected_size = reply.file.size if reply.file else None
     
-    if not filepath:
-        # Download failed - silently fail
-        return
+    if expected_size is not None and expected_size <= MAX_IN_MEMORY_SIZE:
+        buffer = io.BytesIO()
+        try:
+            await _client.download_media(reply, file=buffer)
+        except Exception as e:
+            # Download failed - silently fail
+            logger.warning("Download error: %s", e, exc_info=True)
+            return
+        buffer.seek(0)
+        buffer.name = get_filename(reply)  # Telethon infers the file type from .name
+        media_file = buffer
+        filename = buffer.name
+        file_size = buffer.getbuffer().nbytes
+    else:
+        filepath = await download_media(_client, reply)
+        
+        if not filepath:
+            # Download failed - silently fail
+            return
+        
+        media_file = filepath
+        filename = os.path.basename(filepath)
+        try:
+            file_size = os.path.getsize(filepath)
+        except OSError:
+            file_size = 0
     
     try:
-        # Get file info
-        file_size = os.path.getsize(filepath) if os.path.exists(filepath) else 0
-        filename = os.path.basename(filepath)
-        
         # Create caption
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         chat = await event.get_chat()
@@ -91,7 +116,7 @@ async def save_media_handler(event):
         caption = "\n".join(caption_parts)
         
         # Send to Saved Messages
-        success = await send_to_saved_messages(_client, filepath, caption)
+        success = await send_to_saved_messages(_client, media_file, caption)
         
         if not success:
             # Send failed - silently fail
@@ -99,7 +124,8 @@ async def save_media_handler(event):
             
     finally:
         # Clean up temp file
-        cleanup_temp_file(filepath)
+        if filepath:
+            await cleanup_temp_file(filepath)
 
 
 def setup(client: TelegramClient, loader) -> ModuleInfo:
@@ -128,17 +154,11 @@ def setup(client: TelegramClient, loader) -> ModuleInfo:
     )
     
     # Create the event handler with owner check and auto-delete
-    @client.on(events.NewMessage(pattern=f"^\\.ok$", outgoing=True))
+    @client.on(events.NewMessage(outgoing=True, from_users=owner_id or None, func=OK_FILTER))
     async def ok_handler(event):
-        """Handler wrapper with owner verification."""
-        # Only respond to this userbot's owner
-        if owner_id and event.sender_id != owner_id:
-            return
-        
-        # Don't delete in Saved Messages
-        is_saved_messages = event.chat_id == event.sender_id
-        
-        if not is_saved_messages:
+        """Handler wrapper (non-owner messages are filtered out by from_users)."""
+        # Don't delete in Saved Messages (its chat id is the owner's own id)
+        if event.chat_id != (owner_id or event.sender_id):
             try:
                 # Delete the command message (stealth) - only in other chats
                 await event.delete()
@@ -4,11 +4,12 @@ Contains common operations like message handling, formatting, and file operation
 """
 
 import os
-import sys
 import asyncio
+import logging
 import tempfile
-from typing import Optional, Union, Tuple
-from datetime import datetime
+import time
+from typing import Optional, Union, Tuple, BinaryIO
+from functools import lru_cache
 
 from telethon import TelegramClient
 from telethon.tl.types import (
@@ -25,21 +26,41 @@ from telethon.tl.types import (
     DocumentAttributeSticker,
 )
 
-# Add parent directory to path
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 from config import config
 
 
+logger = logging.getLogger(__name__)
+
+# Telegram message length limit, and the cut point leaving room for "..."
+_TG_MAX_LENGTH = 4096
+_TG_MAX = _TG_MAX_LENGTH - 3
+
+# Timestamp used in generated file names
+_STAMP_FORMAT = "%Y%m%d_%H%M%S"
+
+# Units for format_file_size
+_KB, _MB, _GB = 1024, 1048576, 1073741824
+_SIZE_UNITS = ("B", "KB", "MB", "GB")
+_UNIT_SIZES = (1, _KB, _MB, _GB)
+_MAX_UNIT = len(_SIZE_UNITS) - 1
+
 # Temporary directory for downloaded files
 TEMP_DIR = os.path.join(tempfile.gettempdir(), "userbot_media")
 
 
+# Set once TEMP_DIR has been created (skips the mkdir on later calls)
+_temp_ready = False
+
+
 def ensure_temp_dir():
     """Ensure the temporary directory exists."""
-    if not os.path.exists(TEMP_DIR):
-        os.makedirs(TEMP_DIR)
+    global _temp_ready
+    if not _temp_ready:
+        os.makedirs(TEMP_DIR, exist_ok=True)
+        _temp_ready = True
 
 
+@lru_cache(maxsize=512)
 def get_temp_path(filename: str) -> str:
     """
     Get a path in the temporary directory.
@@ -54,9 +75,9 @@ def get_temp_path(filename: str) -> str:
     return os.path.join(TEMP_DIR, filename)
 
 
-def cleanup_temp_file(filepath: str) -> bool:
+async def cleanup_temp_file(filepath: str) -> bool:
     """
-    Delete a temporary file.
+    Delete a temporary file (in a worker thread, off the event loop).
     
     Args:
         filepath: Path to the file to delete
@@ -65,11 +86,12 @@ def cleanup_temp_file(filepath: str) -> bool:
         True if deleted successfully
     """
     try:
-        if os.path.exists(filepath):
-            os.remove(filepath)
-        return True
+        await asyncio.to_thread(os.remove, filepath)
+    except FileNotFoundError:
+        pass
     except Exception:
         return False
+    return True
 
 
 def is_owner(user_id: int) -> bool:
@@ -141,7 +163,7 @@ def get_filename(message: Message) -> str:
     
     # Photo
     if isinstance(media, MessageMediaPhoto):
-        return f"photo_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
+        return f"photo_{time.strftime(_STAMP_FORMAT)}.jpg"
     
     # Document
     if isinstance(media, MessageMediaDocument):
@@ -157,9 +179,9 @@ def get_filename(message: Message) -> str:
             ext = mime.split("/")[-1]
             if ext == "octet-stream":
                 ext = "bin"
-            return f"file_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{ext}"
+            return f"file_{time.strftime(_STAMP_FORMAT)}.{ext}"
     
-    return f"media_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    return f"media_{time.strftime(_STAMP_FORMAT)}"
 
 
 def has_media(message: Message) -> bool:
@@ -221,17 +243,17 @@ async def download_media(client: TelegramClient, message: Message) -> Optional[s
         
         return downloaded
     except Exception as e:
-        print(f"Download error: {e}")
+        logger.warning("Download error: %s", e, exc_info=True)
         return None
 
 
-async def send_to_saved_messages(client: TelegramClient, filepath: str, caption: str = "") -> bool:
+async def send_to_saved_messages(client: TelegramClient, filepath: Union[str, BinaryIO], caption: str = "") -> bool:
     """
     Send a file to the user's Saved Messages.
     
     Args:
         client: Telethon client
-        filepath: Path to the file to send
+        filepath: Path to the file to send, or a named in-memory file object
         caption: Optional caption for the file
         
     Returns:
@@ -247,7 +269,7 @@ async def send_to_saved_messages(client: TelegramClient, filepath: str, caption:
         )
         return True
     except Exception as e:
-        print(f"Send error: {e}")
+        logger.warning("Send error: %s", e, exc_info=True)
         return False
 
 
@@ -278,14 +300,11 @@ def format_file_size(size_bytes: int) -> str:
     Returns:
         Formatted string (e.g., "1.5 MB")
     """
-    if size_bytes < 1024:
+    # Each unit is 2**10 of the previous one, so bit_length picks it directly
+    idx = min(max(size_bytes.bit_length() - 1, 0) // 10, _MAX_UNIT)
+    if idx == 0:
         return f"{size_bytes} B"
-    elif size_bytes < 1024 * 1024:
-        return f"{size_bytes / 1024:.1f} KB"
-    elif size_bytes < 1024 * 1024 * 1024:
-        return f"{size_bytes / (1024 * 1024):.1f} MB"
-    else:
-        return f"{size_bytes / (1024 * 1024 * 1024):.1f} GB"
+    return f"{size_bytes / _UNIT_SIZES[idx]:.1f} {_SIZE_UNITS[idx]}"
 
 
 def truncate_text(text: str, max_length: int = 4096) -> str:
@@ -305,6 +324,16 @@ def truncate_text(text: str, max_length: int = 4096) -> str:
     return text[:max_length - 3] + "..."
 
 
+def truncate_to_tg(text: str) -> str:
+    """
+    Truncate text to Telegram's 4096-character message limit.
+    Specialised form of truncate_text for the common case.
+    """
+    if len(text) <= _TG_MAX_LENGTH:
+        return text
+    return text[:_TG_MAX] + "..."
+
+
 # Module setup (required for loader)
 def setup(client: TelegramClient, loader) -> None:
     """
@@ -6,17 +6,24 @@ Usage: Reply to any audio/voice/video with .transcribe
 """
 
 import os
-import sys
+import time
+import asyncio
+import tempfile
 import httpx
-import aiofiles
+import orjson
+from types import MappingProxyType
 from typing import Optional
 
 from telethon import TelegramClient, events
 
-# Add parent directory to path
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 from config import config
-from userbot.loader import ModuleInfo
+from userbot.loader import ModuleInfo, command_filter
+from userbot.groq_limits import groq_limiter, transcribe_semaphore, backoff_delay
+from userbot.temp_cleanup import purge_stale_files_once
+from userbot.modules.utils import get_media_type
+
+# Command matcher (string compare, no regex)
+TRANSCRIBE_FILTER = command_filter("transcribe")
 
 # Global vars
 _client: Optional[TelegramClient] = None
@@ -26,6 +33,20 @@ _owner_id: Optional[int] = None
 GROQ_API_URL = "https://api.groq.com/openai/v1/audio/transcriptions"
 WHISPER_MODEL = "whisper-large-v3-turbo"
 TEMP_DIR = "temp_audio"
+# Temp files older than this (seconds) are orphans from a previous run
+STALE_TEMP_AGE = 3600
+
+# Below this size (or download time) the "transcribing" status edit is skipped
+SMALL_FILE_SIZE = 1_000_000
+STATUS_EDIT_DELAY = 0.5
+
+# Transcript parts sent to Telegram at the same time
+MAX_PARALLEL_SENDS = 3
+
+# Media types accepted by .transcribe (see utils.get_media_type)
+TRANSCRIBABLE_TYPES = frozenset({"voice", "audio", "video", "video_note", "animation"})
+# Longest audio (seconds) accepted before downloading anything
+MAX_DURATION = 2 * 60 * 60
 
 # Audio format constants
 AUDIO_MPEG = 'audio/mpeg'
@@ -36,6 +57,91 @@ AUDIO_OPUS = 'audio/opus'
 AUDIO_FLAC = 'audio/flac'
 AUDIO_WEBM = 'audio/webm'
 
+# File extension -> MIME type sent to Groq (read-only)
+_MIME_BY_EXT = MappingProxyType({
+    '.mp3': AUDIO_MPEG,
+    '.mp4': AUDIO_MP4,
+    '.m4a': AUDIO_MP4,
+    '.wav': AUDIO_WAV,
+    '.ogg': AUDIO_OGG,
+    '.oga': AUDIO_OGG,
+    '.opus': AUDIO_OPUS,
+    '.flac': AUDIO_FLAC,
+    '.webm': AUDIO_WEBM,
+    '.mpga': AUDIO_MPEG,
+    '.mpeg': AUDIO_MPEG,
+    # Video files (audio will be extracted)
+    '.mkv': AUDIO_MP4,
+    '.avi': AUDIO_MP4,
+    '.mov': AUDIO_MP4,
+    '.wmv': AUDIO_MP4,
+})
+
+
+# Bytes read from the start of a file for content sniffing
+SNIFF_BYTES = 4096
+
+# Signatures of common files that are certainly not audio/video
+# (JPEG, PNG, GIF, PDF, ZIP/DOCX/APK, RAR, 7z)
+_NON_MEDIA_MAGIC = (
+    b'\xff\xd8\xff', b'\x89PNG', b'GIF8', b'%PDF', b'PK\x03\x04', b'Rar!', b"7z\xbc\xaf'\x1c",
+)
+
+
+def _sniff_mime(header: bytes) -> Optional[str]:
+    """MIME type from a file's magic bytes, or None if not recognised."""
+    if header.startswith(b'OggS'):
+        return AUDIO_OGG
+    if header.startswith(b'fLaC'):
+        return AUDIO_FLAC
+    if header.startswith(b'RIFF') and header[8:12] == b'WAVE':
+        return AUDIO_WAV
+    if header[4:8] == b'ftyp':
+        return AUDIO_MP4  # mp4 / m4a / mov
+    if header.startswith(b'\x1a\x45\xdf\xa3'):
+        return AUDIO_WEBM  # webm / mkv (Matroska)
+    if header.startswith(b'ID3') or (len(header) > 1 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0):
+        return AUDIO_MPEG
+    return None
+
+
+def _mime_for(file_path: str) -> str:
+    """MIME type for a file by extension (defaults to mp3 if unknown)."""
+    return _MIME_BY_EXT.get(os.path.splitext(file_path)[1].lower(), AUDIO_MPEG)
+
+
+# Retries for 429s, 5xx answers and network errors (see groq_limits.backoff_delay)
+MAX_ATTEMPTS = 4
+
+
+# Shared HTTP client (keeps the TLS connection to Groq alive between .transcribe calls)
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    """Get (or lazily create) the shared Groq HTTP client."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            http2=True,
+            timeout=httpx.Timeout(300.0, connect=10.0),
+            limits=httpx.Limits(max_keepalive_connections=4, max_connections=8, keepalive_expiry=120.0)
+        )
+    return _http_client
+
+
+async def close_http_client():
+    """Close the shared HTTP client (call on shutdown)."""
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
+
+
+async def teardown():
+    """Loader shutdown hook: release this userbot's HTTP client."""
+    await close_http_client()
+
 
 async def transcribe_audio(file_path: str) -> str:
     """Transcribe any audio to text. Auto-detects language."""
@@ -43,65 +149,77 @@ async def transcribe_audio(file_path: str) -> str:
         return "❌ GROQ_API_KEY sozlanmagan"
     
     try:
-        # Get file extension and determine MIME type
-        ext = os.path.splitext(file_path)[1].lower()
-        mime_types = {
-            '.mp3': AUDIO_MPEG,
-            '.mp4': AUDIO_MP4,
-            '.m4a': AUDIO_MP4,
-            '.wav': AUDIO_WAV,
-            '.ogg': AUDIO_OGG,
-            '.oga': AUDIO_OGG,
-            '.opus': AUDIO_OPUS,
-            '.flac': AUDIO_FLAC,
-            '.webm': AUDIO_WEBM,
-            '.mpga': AUDIO_MPEG,
-            '.mpeg': AUDIO_MPEG,
-            # Video files (audio will be extracted)
-            '.mkv': AUDIO_MP4,
-            '.avi': AUDIO_MP4,
-            '.mov': AUDIO_MP4,
-            '.wmv': AUDIO_MP4,
+        data = {
+            "model": WHISPER_MODEL,
+            # No language specified = auto-detect
+            "response_format": "json",
+            "temperature": 0.0  # More accurate
+        }
+        headers = {
+            "Authorization": f"Bearer {config.GROQ_API_KEY}"
         }
-        # Default to mp3 if unknown
-        mime_type = mime_types.get(ext, AUDIO_MPEG)
         
-        async with aiofiles.open(file_path, "rb") as audio_file:
-            file_content = await audio_file.read()
+        # httpx streams the open file into the multipart body chunk by chunk
+        with open(file_path, "rb") as audio_file:
+            # Trust the file's magic bytes over its (often generic) name
+            header = audio_file.read(SNIFF_BYTES)
+            if header.startswith(_NON_MEDIA_MAGIC):
+                return "❌ Fayl audio yoki video emas"
+            mime_type = _sniff_mime(header) or _mime_for(file_path)
+            
             files = {
-                "file": (os.path.basename(file_path), file_content, mime_type),
-            }
-            data = {
-                "model": WHISPER_MODEL,
-                # No language specified = auto-detect
-                "response_format": "json",
-                "temperature": 0.0  # More accurate
+                "file": (os.path.basename(file_path), audio_file, mime_type),
             }
-            headers = {
-                "Authorization": f"Bearer {config.GROQ_API_KEY}"
-            }
-            
-            async with httpx.AsyncClient(timeout=300.0) as client:
-                response = await client.post(
-                    GROQ_API_URL,
-                    files=files,
-                    data=data,
-                    headers=headers
-                )
+            est_tokens = os.fstat(audio_file.fileno()).st_size // 1000
+            for attempt in range(MAX_ATTEMPTS):
+                await groq_limiter.wait_if_throttled(est_tokens)
+                audio_file.seek(0)
+                last_attempt = attempt == MAX_ATTEMPTS - 1
+                try:
+                    # Only the upload itself is capped; downloads run freely
+                    async with transcribe_semaphore:
+                        response = await _get_http_client().post(
+                            GROQ_API_URL,
+                            files=files,
+                            data=data,
+                            headers=headers
+                        )
+                except httpx.TransportError:
+                    # Connection reset / timeout - worth another try
+                    if last_attempt:
+                        raise
+                    await asyncio.sleep(backoff_delay(attempt))
+                    continue
                 
-                if response.status_code == 200:
-                    result = response.json()
-                    text = result.get("text", "").strip()
-                    if not text:
-                        return "❌ Matn topilmadi"
-                    return text
+                groq_limiter.update(response.headers)
+                if response.status_code == 429 and not last_attempt:
+                    groq_limiter.block_for(backoff_delay(attempt, response.headers.get("retry-after")))
+                elif response.status_code >= 500 and not last_attempt:
+                    await asyncio.sleep(backoff_delay(attempt))
                 else:
-                    return f"❌ API xatolik {response.status_code}: {response.text[:200]}"
+                    break
+        
+        if response.status_code == 200:
+            result = orjson.loads(response.content)
+            text = result.get("text", "").strip()
+            if not text:
+                return "❌ Matn topilmadi"
+            return text
+        else:
+            return f"❌ API xatolik {response.status_code}: {response.text[:200]}"
     
     except Exception as e:
         return f"❌ Xatolik: {str(e)}"
 
 
+def _remove_file(file_path: str):
+    """Delete a file in one syscall, ignoring it if already gone."""
+    try:
+        os.remove(file_path)
+    except OSError:
+        pass
+
+
 async def _safe_edit(msg, event, text: str):
     """Safely edit message, fallback to respond if edit fails."""
     try:
@@ -138,13 +256,19 @@ async def _send_result(event, text: str):
         f"{parts[0]}"
     )
     
-    # Remaining parts
-    for idx in range(1, total):
+    # Remaining parts go out concurrently (each is labelled, so order is
+    # still clear); the semaphore keeps bursts below Telegram's flood limits
+    send_sem = asyncio.Semaphore(MAX_PARALLEL_SENDS)
+    
+    async def send_part(idx: int):
         last = (idx == total - 1)
-        await event.respond(
-            f"**Qism {idx+1}/{total}**\n\n"
-            f"{parts[idx]}{footer if last else ''}"
-        )
+        async with send_sem:
+            await event.respond(
+                f"**Qism {idx+1}/{total}**\n\n"
+                f"{parts[idx]}{footer if last else ''}"
+            )
+    
+    await asyncio.gather(*(send_part(idx) for idx in range(1, total)))
 
 
 async def handle_transcribe(event):
@@ -162,6 +286,22 @@ async def handle_transcribe(event):
         await event.respond("❌ Xabarda media topilmadi!")
         return
     
+    # Only media with a sound track is worth downloading and uploading
+    media_type = get_media_type(reply_msg)
+    mime = (reply_msg.file.mime_type or "") if reply_msg.file else ""
+    if media_type not in TRANSCRIBABLE_TYPES and not mime.startswith(("audio/", "video/")):
+        await event.respond("❌ Bu xabarda audio yoki video yo'q!")
+        return
+    
+    duration = reply_msg.file.duration if reply_msg.file else None
+    if duration and duration > MAX_DURATION:
+        await event.respond(
+            f"❌ **Audio juda uzun!**\n\n"
+            f"**Davomiyligi:** {duration // 60} daqiqa\n"
+            f"**Maksimal:** {MAX_DURATION // 60} daqiqa"
+        )
+        return
+    
     # Check file size (25MB limit for Groq)
     file_size = 0
     if hasattr(reply_msg, 'file') and reply_msg.file:
@@ -178,34 +318,31 @@ async def handle_transcribe(event):
     processing_msg = await event.respond(
         f"🎙️ Yuklanmoqda... ({file_size/(1024*1024):.1f} MB)"
     )
+    started = time.monotonic()
     
-    file_path = None
+    tmp_path = file_path = None
     try:
-        os.makedirs(TEMP_DIR, exist_ok=True)
+        # Orphans from a crashed run are cleared once per process, off the loop
+        await purge_stale_files_once(TEMP_DIR, STALE_TEMP_AGE)
+        
+        # Unique temp file owned by this call; the finally below always removes it
+        suffix = reply_msg.file.ext if reply_msg.file else None
+        with tempfile.NamedTemporaryFile(dir=TEMP_DIR, suffix=suffix or "", delete=False) as tmp:
+            tmp_path = tmp.name
         
         # Download media
-        file_path = await reply_msg.download_media(file=TEMP_DIR)
+        file_path = await reply_msg.download_media(file=tmp_path)
         
         if not file_path:
             await _safe_edit(processing_msg, event, "❌ Media yuklanmadi")
             return
         
-        # Check if file exists
-        if not os.path.exists(file_path):
-            await _safe_edit(processing_msg, event, "❌ Yuklangan fayl topilmadi")
-            return
-        
-        # Transcribe
-        await _safe_edit(processing_msg, event, "🔄 Whisper AI bilan matnga aylantirilmoqda...")
+        # Transcribe (Telethon returns the path it wrote, no need to re-stat it).
+        # Short voice notes finish quickly, so skip the status edit round-trip
+        if file_size >= SMALL_FILE_SIZE and time.monotonic() - started >= STATUS_EDIT_DELAY:
+            await _safe_edit(processing_msg, event, "🔄 Whisper AI bilan matnga aylantirilmoqda...")
         text = await transcribe_audio(file_path)
         
-        # Cleanup
-        if file_path and os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-            except OSError:
-                pass
-        
         # Result - delete processing msg and send new
         try:
             await processing_msg.delete()
@@ -220,12 +357,13 @@ async def handle_transcribe(event):
     except Exception as e:
         error_msg = f"❌ Xatolik: {str(e)[:200]}"
         await _safe_edit(processing_msg, event, error_msg)
-        # Cleanup on error
-        if file_path and os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-            except OSError:
-                pass
+    
+    finally:
+        # Unlink in a worker thread so a slow filesystem can't stall the loop
+        if tmp_path:
+            await asyncio.to_thread(_remove_file, tmp_path)
+        if file_path and file_path != tmp_path:
+            await asyncio.to_thread(_remove_file, file_path)
 
 
 def setup(client: TelegramClient, loader) -> ModuleInfo:
@@ -234,6 +372,8 @@ def setup(client: TelegramClient, loader) -> ModuleInfo:
     _client = client
     _owner_id = loader.owner_id
     
+    os.makedirs(TEMP_DIR, exist_ok=True)
+    
     if not config.validate_groq():
         print("   ⚠️ Transcription: GROQ_API_KEY not configured")
         return ModuleInfo(
@@ -248,13 +388,17 @@ def setup(client: TelegramClient, loader) -> ModuleInfo:
         commands=["transcribe"]
     )
     
+    # One .transcribe handler per client - a second one would transcribe
+    # (and bill Groq for) every file twice
+    if getattr(client, "_transcribe_registered", False):
+        print("   ⚠️ Transcription: handler already registered, skipping")
+        return module_info
+    client._transcribe_registered = True
+    
     # Single universal command
-    @client.on(events.NewMessage(pattern=r"^\.transcribe$", outgoing=True))
+    @client.on(events.NewMessage(outgoing=True, from_users=_owner_id or None, func=TRANSCRIBE_FILTER))
     async def transcribe_cmd(event):
         """Universal transcription command."""
-        if _owner_id and event.sender_id != _owner_id:
-            return
-        
         try:
             await event.delete()
         except Exception:
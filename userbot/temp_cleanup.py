@@ -0,0 +1,38 @@
+"""
+Process-wide cleanup of temp files left behind by a crashed or killed run.
+Userbot modules are executed once per user, so the "only once" bookkeeping
+lives here, in a normally imported module.
+"""
+
+import os
+import time
+import asyncio
+from typing import Set
+
+
+# Directories already purged by this process
+_purged_dirs: Set[str] = set()
+
+
+def _purge_stale_files(directory: str, max_age: float):
+    """Delete regular files in directory older than max_age seconds (blocking)."""
+    cutoff = time.time() - max_age
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file(follow_symlinks=False) and entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                except OSError:
+                    pass
+    except FileNotFoundError:
+        pass
+
+
+async def purge_stale_files_once(directory: str, max_age: float):
+    """Purge stale files from directory the first time it is asked for in this process."""
+    if directory in _purged_dirs:
+        return
+    # Mark first so concurrent callers don't start a second scan
+    _purged_dirs.add(directory)
+    await asyncio.to_thread(_purge_stale_files, directory, max_age)